@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from typing import List, Any
 
@@ -43,7 +44,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK: dict[str, Any] = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'content.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 100
@@ -60,17 +61,78 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
+        'OPTIONS': {
+            # Room for the ratings of every channel, see `RATING_WARMUP_MAX_CHANNELS`.
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Single-flight recomputation of invalidated ratings: the lock of a rating
+# being recomputed expires after `RATING_LOCK_TIMEOUT` seconds, meanwhile
+# other readers get the previous rating for up to `RATING_STALE_TIMEOUT`
+# seconds after the invalidation or wait up to `RATING_LOCK_WAIT` seconds.
+RATING_LOCK_TIMEOUT = 30
+RATING_LOCK_WAIT = 2
+RATING_STALE_TIMEOUT = 300
+
+# Rating cache warm-up, see the `warm_ratings` command. On startup it runs
+# in a background thread of every worker after `RATING_WARMUP_DELAY` seconds.
+RATING_WARMUP_ON_STARTUP = False
+RATING_WARMUP_DELAY = 5
+RATING_WARMUP_RATE = 5000  # Channels per second
+RATING_WARMUP_BATCH_SIZE = 500
+RATING_WARMUP_TIMEOUT = 3600  # Seconds
+# Channels warmed up at most, in priority order, well under the entries of
+# the cache as it also holds the read counters, locks and stale ratings.
+RATING_WARMUP_MAX_CHANNELS = 40000
+
+# Seconds before each process reloads its channel tree, see `content.tree`,
+# even if the version hasn't changed.
+CHANNEL_TREE_MAX_AGE = 60
+
+# Channel subtrees are deleted in a background thread of the worker, see
+# `content.deletion`, or within the request with `CHANNEL_DELETION_EAGER`.
+# Jobs without progress for `CHANNEL_DELETION_STALE_AFTER` are failed.
+CHANNEL_DELETION_EAGER = False
+CHANNEL_DELETION_BATCH_SIZE = 500
+CHANNEL_DELETION_FILE_WORKERS = 8
+CHANNEL_DELETION_STALE_AFTER = 300  # Seconds
+
+# Admission control per route class, see `content.middleware.AdmissionControlMiddleware`.
+# The concurrent requests `limit` of each class adapts between `min_limit` and
+# `max_limit` to keep their latency under `target_latency` seconds, up to `queue`
+# requests wait up to `queue_timeout` seconds for a slot and the rejected ones
+# are told to retry after `retry_after` seconds.
+ADMISSION_CONTROL: dict[str, dict[str, Any]] = {
+    'cheap_reads': {
+        'limit': 32, 'min_limit': 4, 'max_limit': 128,
+        'queue': 64, 'queue_timeout': 0.5, 'target_latency': 0.05, 'retry_after': 1,
+    },
+    'expensive_reads': {
+        'limit': 8, 'min_limit': 2, 'max_limit': 32,
+        'queue': 32, 'queue_timeout': 1.0, 'target_latency': 0.5, 'retry_after': 2,
+    },
+    'uploads': {
+        'limit': 4, 'min_limit': 1, 'max_limit': 16,
+        'queue': 8, 'queue_timeout': 2.0, 'target_latency': 5.0, 'retry_after': 5,
+    },
+    'bulk_writes': {
+        'limit': 4, 'min_limit': 1, 'max_limit': 16,
+        'queue': 16, 'queue_timeout': 2.0, 'target_latency': 1.0, 'retry_after': 5,
+    },
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'content.middleware.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'content.middleware.PrimaryPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'ImmflyBackend.urls'
@@ -102,9 +164,50 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests instead of opening one per request.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when the transaction starts, so writers wait
+            # for the busy timeout instead of failing to upgrade a read lock.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Pragmas applied to every new SQLite connection by `content.db.configure_sqlite_connection`.
+# WAL lets readers run concurrently with a writer, and with it `synchronous=NORMAL` is still
+# safe from corruption, only the last transactions may be lost on a power failure.
+SQLITE_PRAGMAS: dict[str, str | int] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # Milliseconds
+    'cache_size': -65536,  # Negative is in KiB, 64 MiB
+    'mmap_size': 268435456,  # Bytes, 256 MiB
+    'temp_store': 'MEMORY',
+}
+
+# Read replicas of the `default` database, reads are routed to them by
+# `content.db.PrimaryReplicaRouter`. A copy of the SQLite file can stand
+# in for a replica locally setting `SQLITE_REPLICA` to its path.
+DATABASE_REPLICAS: list[str] = []
+
+if os.environ.get('SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['SQLITE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append('replica')
+
+DATABASE_ROUTERS = ['content.db.PrimaryReplicaRouter']
+
+# Seconds the reads of a client stay on the primary after it writes.
+PRIMARY_PIN_SECONDS = 10
+
+# Seconds before retrying a replica that couldn't be connected to.
+REPLICA_RETRY_SECONDS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ContentConfig(AppConfig):
@@ -6,4 +7,8 @@ class ContentConfig(AppConfig):
     name = 'content'
 
     def ready(self) -> None:
-        from . import signals
+        from . import db, signals
+
+        if settings.RATING_WARMUP_ON_STARTUP:
+            from .warmup import schedule_startup_warmup
+            schedule_startup_warmup()
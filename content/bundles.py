@@ -0,0 +1,417 @@
+"""
+Offline catalog bundles.
+
+A bundle is a ZIP archive with the manifest of a channel subtree (channels,
+ratings and contents), the media files it references and a checksum of the
+manifest. Every media file is listed in the manifest with its SHA-256 and the
+SHA-256 of each fixed size chunk, so a delta between two bundle versions only
+needs to carry the files, or the chunks of large files, that changed.
+
+Media is always streamed through temporary files chunk by chunk, so memory
+usage is bounded by the chunk size and the number of workers, not by the
+size of the catalog.
+"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import IO, Any, TypeVar
+
+from django.core.files.storage import default_storage
+
+from content.models import Channel, Content, ContentFile
+
+
+FORMAT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+MANIFEST_NAME = 'manifest.json'
+CHECKSUM_NAME = 'manifest.sha256'
+DELTA_NAME = 'delta.json'
+MEDIA_PREFIX = 'media/'
+CHUNKS_PREFIX = 'chunks/'
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class BundleError(Exception):
+    """
+    Raised when a bundle or delta is malformed or fails an integrity check.
+    """
+
+
+@dataclass
+class SpooledFile:
+    """
+    A media file copied to a temporary path together with its manifest entry.
+    """
+    name: str
+    path: str
+    entry: dict[str, Any]
+
+
+def _bounded_map(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    workers: int,
+    discard: Callable[[R], None] | None = None,
+) -> Iterator[R]:
+    """
+    Like `Executor.map` but keeping at most `workers * 2` tasks in flight,
+    so results that wait to be consumed can't pile up in memory or on disk.
+
+    When a task fails, or the caller stops early, the pending tasks are
+    cancelled and `discard` is called with the results of those already running.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: list[Future[R]] = []
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= workers * 2:
+                    yield pending.pop(0).result()
+            while pending:
+                yield pending.pop(0).result()
+        finally:
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if discard and not future.cancelled() and future.exception() is None:
+                    discard(future.result())
+
+
+def _spool(name: str, chunks: Iterable[bytes]) -> SpooledFile:
+    """
+    Writes `chunks` to a temporary file computing the hashes of the whole file and of each chunk.
+    """
+    file_hash = hashlib.sha256()
+    chunk_hashes = []
+    size = 0
+    fd, path = tempfile.mkstemp(prefix='bundle-')
+    try:
+        with os.fdopen(fd, 'wb') as spool:
+            for chunk in chunks:
+                file_hash.update(chunk)
+                chunk_hashes.append(hashlib.sha256(chunk).hexdigest())
+                size += len(chunk)
+                spool.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledFile(name, path, {
+        'size': size,
+        'sha256': file_hash.hexdigest(),
+        'chunks': chunk_hashes,
+    })
+
+
+def _read_chunks(stream: IO[bytes], chunk_size: int) -> Iterator[bytes]:
+    while chunk := stream.read(chunk_size):
+        yield chunk
+
+
+def _dump_manifest(manifest: dict[str, Any]) -> bytes:
+    return json.dumps(manifest, sort_keys=True, separators=(',', ':')).encode()
+
+
+def _write_manifest(archive: zipfile.ZipFile, manifest: dict[str, Any]) -> str:
+    data = _dump_manifest(manifest)
+    checksum = hashlib.sha256(data).hexdigest()
+    archive.writestr(MANIFEST_NAME, data)
+    archive.writestr(CHECKSUM_NAME, checksum)
+    return checksum
+
+
+def _store(archive: zipfile.ZipFile, spooled: SpooledFile) -> None:
+    try:
+        archive.write(spooled.path, MEDIA_PREFIX + spooled.name)
+    finally:
+        _discard(spooled)
+
+
+def _discard(spooled: SpooledFile) -> None:
+    os.unlink(spooled.path)
+
+
+@contextlib.contextmanager
+def _output_archive(output: str) -> Iterator[zipfile.ZipFile]:
+    """
+    Opens `output` to write an archive, removing it if the archive can't be completed.
+    """
+    try:
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            yield archive
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(output)
+        raise
+
+
+def read_manifest(archive: zipfile.ZipFile) -> tuple[dict[str, Any], str]:
+    """
+    Returns the manifest of a bundle and its checksum, verifying it.
+    """
+    try:
+        data = archive.read(MANIFEST_NAME)
+        checksum = archive.read(CHECKSUM_NAME).decode().strip()
+    except KeyError as error:
+        raise BundleError(f"Not a catalog bundle: {error}") from error
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise BundleError("Manifest checksum mismatch")
+    manifest = json.loads(data)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')}")
+    return manifest, checksum
+
+
+def _subtree(root: Channel) -> list[Channel]:
+    channels = [root]
+    level = [root.pk]
+    while level:
+        children = list(Channel.objects.filter(parent_id__in=level).order_by('pk'))
+        channels.extend(children)
+        level = [child.pk for child in children]
+    return channels
+
+
+def collect_manifest(root: Channel, version: str, chunk_size: int) -> tuple[dict[str, Any], list[str]]:
+    """
+    Builds the manifest of the subtree of `root`, without the media
+    entries, and returns it with the names of the media files to include.
+    """
+    channels = _subtree(root)
+    contents = list(
+        Content.objects
+        .filter(channel__in=channels)
+        .prefetch_related('files')
+        .order_by('pk')
+    )
+
+    media: list[str] = []
+    channel_entries = []
+    for channel in channels:
+        rating = channel.rating()
+        if channel.picture:
+            media.append(channel.picture.name)
+        channel_entries.append({
+            'id': channel.pk,
+            'parent': channel.parent_id if channel.pk != root.pk else None,
+            'title': channel.title,
+            'language': channel.language,
+            'picture': channel.picture.name if channel.picture else None,
+            'rating': str(rating) if rating is not None else None,
+        })
+
+    content_entries = []
+    for content in contents:
+        files: list[ContentFile] = sorted(content.files.all(), key=lambda f: f.pk)
+        media.extend(file.file.name for file in files)
+        content_entries.append({
+            'id': content.pk,
+            'channel': content.channel_id,
+            'metadata': content.metadata,
+            'rating': str(content.rating),
+            'files': [file.file.name for file in files],
+        })
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'root': root.pk,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'chunk_size': chunk_size,
+        'channels': channel_entries,
+        'contents': content_entries,
+        'files': {},
+    }
+    return manifest, sorted(set(media))
+
+
+def build_bundle(
+    root: Channel,
+    output: str,
+    version: str | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 4,
+) -> dict[str, Any]:
+    """
+    Writes the bundle of the subtree of `root` to `output` and returns its manifest.
+    """
+    version = version or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    manifest, media = collect_manifest(root, version, chunk_size)
+
+    def spool_media(name: str) -> SpooledFile:
+        with default_storage.open(name, 'rb') as stream:
+            return _spool(name, _read_chunks(stream, chunk_size))
+
+    with _output_archive(output) as archive:
+        for spooled in _bounded_map(spool_media, media, workers, discard=_discard):
+            manifest['files'][spooled.name] = spooled.entry
+            _store(archive, spooled)
+        _write_manifest(archive, manifest)
+
+    return manifest
+
+
+def verify_bundle(path: str, workers: int = 4) -> dict[str, Any]:
+    """
+    Checks the manifest checksum and the hash of every media file of a bundle.
+    """
+    with zipfile.ZipFile(path) as archive:
+        manifest, _checksum = read_manifest(archive)
+
+    def check(item: tuple[str, dict[str, Any]]) -> None:
+        name, entry = item
+        digest = hashlib.sha256()
+        with zipfile.ZipFile(path) as archive, archive.open(MEDIA_PREFIX + name) as stream:
+            for chunk in _read_chunks(stream, manifest['chunk_size']):
+                digest.update(chunk)
+        if digest.hexdigest() != entry['sha256']:
+            raise BundleError(f"Hash mismatch for {name}")
+
+    for _ in _bounded_map(check, manifest['files'].items(), workers):
+        pass
+    return manifest
+
+
+def build_delta(base_path: str, target_path: str, output: str) -> dict[str, Any]:
+    """
+    Writes a delta that turns the bundle at `base_path` into the one at
+    `target_path`. Only new or changed media are included; files that exist
+    in both versions and span more than one chunk are diffed chunk by chunk.
+    """
+    with zipfile.ZipFile(base_path) as base, zipfile.ZipFile(target_path) as target:
+        base_manifest, base_checksum = read_manifest(base)
+        target_manifest, target_checksum = read_manifest(target)
+        if base_manifest['chunk_size'] != target_manifest['chunk_size']:
+            raise BundleError("Bundles were built with different chunk sizes")
+        chunk_size = target_manifest['chunk_size']
+
+        base_files: dict[str, dict[str, Any]] = base_manifest['files']
+        target_files: dict[str, dict[str, Any]] = target_manifest['files']
+
+        delta: dict[str, Any] = {
+            'format': FORMAT_VERSION,
+            'base': {'version': base_manifest['version'], 'sha256': base_checksum},
+            'target': {'version': target_manifest['version'], 'sha256': target_checksum},
+            'removed': sorted(set(base_files) - set(target_files)),
+            'files': {},
+        }
+
+        with _output_archive(output) as archive:
+            written_chunks: set[str] = set()
+            for name, entry in sorted(target_files.items()):
+                old = base_files.get(name)
+                if old and old['sha256'] == entry['sha256']:
+                    continue
+
+                if not old or len(entry['chunks']) <= 1:
+                    delta['files'][name] = {'mode': 'full'}
+                    with target.open(MEDIA_PREFIX + name) as source, \
+                            archive.open(MEDIA_PREFIX + name, 'w') as destination:
+                        for chunk in _read_chunks(source, chunk_size):
+                            destination.write(chunk)
+                    continue
+
+                old_chunks = {digest: index for index, digest in enumerate(old['chunks'])}
+                ops: list[list[Any]] = []
+                with target.open(MEDIA_PREFIX + name) as source:
+                    for digest, chunk in zip(entry['chunks'], _read_chunks(source, chunk_size)):
+                        if digest in old_chunks:
+                            ops.append(['base', old_chunks[digest]])
+                            continue
+                        ops.append(['delta', digest])
+                        if digest not in written_chunks:
+                            archive.writestr(CHUNKS_PREFIX + digest, chunk)
+                            written_chunks.add(digest)
+                delta['files'][name] = {'mode': 'chunks', 'ops': ops}
+
+            archive.writestr(MANIFEST_NAME, _dump_manifest(target_manifest))
+            archive.writestr(CHECKSUM_NAME, target_checksum)
+            archive.writestr(DELTA_NAME, json.dumps(delta, sort_keys=True))
+
+    return delta
+
+
+def apply_delta(base_path: str, delta_path: str, output: str, workers: int = 4) -> dict[str, Any]:
+    """
+    Rebuilds the target bundle of a delta from its base bundle, verifying
+    the base version and the hash of every rebuilt file.
+    """
+    with zipfile.ZipFile(base_path) as base, zipfile.ZipFile(delta_path) as patch:
+        base_manifest, base_checksum = read_manifest(base)
+        target_manifest, target_checksum = read_manifest(patch)
+        try:
+            delta = json.loads(patch.read(DELTA_NAME))
+        except KeyError as error:
+            raise BundleError("Not a bundle delta") from error
+
+    if delta['base']['sha256'] != base_checksum:
+        raise BundleError(
+            f"Delta applies to version {delta['base']['version']}, not {base_manifest['version']}"
+        )
+    if delta['target']['sha256'] != target_checksum:
+        raise BundleError("Delta manifest checksum mismatch")
+
+    chunk_size = target_manifest['chunk_size']
+    changes: dict[str, dict[str, Any]] = delta['files']
+
+    def rebuild(name: str) -> SpooledFile:
+        entry = target_manifest['files'][name]
+        change = changes.get(name, {'mode': 'base'})
+        with zipfile.ZipFile(base_path) as base, zipfile.ZipFile(delta_path) as patch:
+            if change['mode'] == 'base':
+                with base.open(MEDIA_PREFIX + name) as stream:
+                    spooled = _spool(name, _read_chunks(stream, chunk_size))
+            elif change['mode'] == 'full':
+                with patch.open(MEDIA_PREFIX + name) as stream:
+                    spooled = _spool(name, _read_chunks(stream, chunk_size))
+            else:
+                # Compressed members can't be read at random offsets, so the
+                # base file is extracted first to serve the reused chunks.
+                with base.open(MEDIA_PREFIX + name) as stream:
+                    old = _spool(name, _read_chunks(stream, chunk_size))
+                try:
+                    with open(old.path, 'rb') as old_file:
+                        spooled = _spool(name, _rebuild_chunks(change['ops'], old_file, patch, chunk_size))
+                finally:
+                    os.unlink(old.path)
+
+        if spooled.entry['sha256'] != entry['sha256']:
+            _discard(spooled)
+            raise BundleError(f"Hash mismatch for {name}")
+        return spooled
+
+    with _output_archive(output) as archive:
+        for spooled in _bounded_map(rebuild, sorted(target_manifest['files']), workers, discard=_discard):
+            _store(archive, spooled)
+        if _write_manifest(archive, target_manifest) != target_checksum:
+            raise BundleError("Rebuilt manifest checksum mismatch")
+
+    return target_manifest
+
+
+def _rebuild_chunks(
+    ops: list[list[Any]],
+    old_file: IO[bytes],
+    patch: zipfile.ZipFile,
+    chunk_size: int,
+) -> Iterator[bytes]:
+    for source, reference in ops:
+        if source == 'base':
+            old_file.seek(reference * chunk_size)
+            yield old_file.read(chunk_size)
+        else:
+            chunk = patch.read(CHUNKS_PREFIX + reference)
+            if hashlib.sha256(chunk).hexdigest() != reference:
+                raise BundleError(f"Hash mismatch for chunk {reference}")
+            yield chunk
@@ -0,0 +1,130 @@
+"""
+Database routing between the primary (`default`) database and its read
+replicas, and the setup of new SQLite connections.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+import weakref
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.db.models import Model
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_pinned_to_primary: ContextVar[bool] = ContextVar('pinned_to_primary', default=False)
+
+
+def pin_to_primary() -> None:
+    """
+    Sends the following reads of the current request, or command, to the primary.
+    """
+    _pinned_to_primary.set(True)
+
+
+def is_pinned_to_primary() -> bool:
+    return _pinned_to_primary.get()
+
+
+@contextmanager
+def use_primary(pinned: bool = True) -> Iterator[None]:
+    """
+    Pins, or unpins, reads to the primary for the duration of the block.
+    """
+    token = _pinned_to_primary.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the primary and reads to one of `settings.DATABASE_REPLICAS`.
+
+    Replicas lag behind the primary, so reads stay on the primary once the
+    current context has written (see `PrimaryPinningMiddleware` to extend it
+    to the following requests of the same client). A replica that can't be
+    connected to, or lacks the table of the model, e.g. an empty SQLite file,
+    is skipped for `settings.REPLICA_RETRY_SECONDS`, falling back to the
+    primary when none is left.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._unavailable_until: dict[str, float] = {}
+        # Tables of each replica connection, introspected once per underlying connection.
+        self._tables: weakref.WeakKeyDictionary[BaseDatabaseWrapper, tuple[Any, frozenset[str]]] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def db_for_read(self, model: type[Model], **hints: Any) -> str:
+        if is_pinned_to_primary():
+            return DEFAULT_DB_ALIAS
+
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if self._is_available(alias, model._meta.db_table)
+        ]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model: type[Model], **hints: Any) -> str:
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints: Any) -> bool | None:
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def _is_available(self, alias: str, table: str) -> bool:
+        with self._lock:
+            if self._unavailable_until.get(alias, 0) > time.monotonic():
+                return False
+
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+            available = table in self._table_names(connection)
+        except DatabaseError:
+            available = False
+        if not available:
+            logger.warning("Replica %s is unavailable or lacks table %s", alias, table)
+            # Reconnect, and introspect again, on the next retry.
+            connection.close()
+            with self._lock:
+                self._unavailable_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        return available
+
+    def _table_names(self, connection: BaseDatabaseWrapper) -> frozenset[str]:
+        with self._lock:
+            tables = self._tables.get(connection)
+        if tables is None or tables[0] is not connection.connection:
+            tables = (connection.connection, frozenset(connection.introspection.table_names()))
+            with self._lock:
+                self._tables[connection] = tables
+        return tables[1]
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender: Any, connection: BaseDatabaseWrapper, **_kwargs: Any) -> None:
+    """
+    Applies `settings.SQLITE_PRAGMAS` to every new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    for pragma, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f"PRAGMA {pragma} = {value}")
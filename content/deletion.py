@@ -0,0 +1,192 @@
+"""
+Background deletion of channel subtrees.
+
+`channel.delete()` collects the whole subtree in memory and sends the delete
+signals once per channel, content and file, each of them invalidating the
+ratings of every ancestor or removing a single file, all while holding the
+write lock. Subtrees are instead deleted from the deepest channels up, in
+bounded batches each in its own short transaction and without the signals.
+The files are removed in bulk by a thread pool after each batch and the
+ancestors are invalidated once at the end.
+
+Jobs run in a background thread of the process that accepts them and their
+status is kept in the database, so clients can poll it from any worker. Jobs
+without progress for `settings.CHANNEL_DELETION_STALE_AFTER` seconds, as when
+their worker is stopped, are reported as failed.
+"""
+from __future__ import annotations
+
+import copy
+import logging
+import threading
+import uuid
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, cast
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, router, transaction
+from django.db.models import FileField
+from django.db.models.sql.subqueries import DeleteQuery
+from django.utils import timezone
+
+from content import singleflight, tree
+from content.db import use_primary
+from content.models import Channel, ChannelDeletionJob, Content, ContentFile
+
+logger = logging.getLogger(__name__)
+
+Status = ChannelDeletionJob.Status
+
+
+def get_job(job_id: uuid.UUID) -> ChannelDeletionJob | None:
+    """
+    Returns a job, marked as failed if it made no progress for too long.
+    """
+    # Jobs are created and updated on the primary, replicas may not have them yet.
+    with use_primary():
+        job = ChannelDeletionJob.objects.filter(pk=job_id).first()
+    stale_before = timezone.now() - timedelta(seconds=settings.CHANNEL_DELETION_STALE_AFTER)
+    if job is not None and job.status in (Status.PENDING, Status.RUNNING) and job.updated_at < stale_before:
+        job.status = Status.FAILED
+        job.error = 'Interrupted, the channel may be partially deleted'
+        job.save()
+    return job
+
+
+def job_representation(job: ChannelDeletionJob) -> dict[str, Any]:
+    representation: dict[str, Any] = {
+        'id': job.id.hex,
+        'channel': job.channel_id,
+        'status': job.status,
+        'channels': job.channels,
+        'contents': job.contents,
+        'files': job.files,
+    }
+    if job.error:
+        representation['error'] = job.error
+    return representation
+
+
+def _chunks(items: list[int], size: int) -> Iterator[list[int]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _levels(pk: int) -> list[list[int]]:
+    """
+    Returns the channels of the subtree of `pk` grouped by depth, starting with `pk`.
+    """
+    levels = [[pk]]
+    while levels[-1]:
+        levels.append([
+            child for chunk in _chunks(levels[-1], settings.CHANNEL_DELETION_BATCH_SIZE)
+            for child in Channel.objects.filter(parent_id__in=chunk).values_list('pk', flat=True)
+        ])
+    return levels[:-1]
+
+
+def _delete_files(storage_names: list[tuple[FileField, str]], executor: ThreadPoolExecutor) -> None:
+    def delete(item: tuple[FileField, str]) -> None:
+        field, name = item
+        try:
+            field.storage.delete(name)
+        except OSError:
+            logger.warning("Could not delete file %s of a deleted channel", name, exc_info=True)
+
+    for _ in executor.map(delete, storage_names):
+        pass
+
+
+def _delete_batch(channel_ids: list[int], job: ChannelDeletionJob, using: str) -> list[tuple[FileField, str]]:
+    """
+    Deletes a batch of channels without sub-channels, with their contents and files,
+    and returns the files to remove from the storage.
+    """
+    batch_size = settings.CHANNEL_DELETION_BATCH_SIZE
+    file_field = cast(FileField, ContentFile._meta.get_field('file'))
+    picture_field = cast(FileField, Channel._meta.get_field('picture'))
+    files: list[tuple[FileField, str]] = []
+    deleted = {'channels': 0, 'contents': 0, 'files': 0}
+
+    with transaction.atomic(using=using):
+        content_ids = list(Content.objects.using(using).filter(channel_id__in=channel_ids).values_list('pk', flat=True))
+        for chunk in _chunks(content_ids, batch_size):
+            rows = list(ContentFile.objects.using(using).filter(content_id__in=chunk).values_list('pk', 'file'))
+            DeleteQuery(ContentFile).delete_batch([pk for pk, _name in rows], using)
+            files += [(file_field, name) for _pk, name in rows if name]
+            deleted['files'] += len(rows)
+            deleted['contents'] += DeleteQuery(Content).delete_batch(chunk, using)
+
+        pictures = Channel.objects.using(using).filter(pk__in=channel_ids).exclude(picture='')
+        files += [(picture_field, name) for name in pictures.values_list('picture', flat=True) if name]
+        deleted['channels'] += DeleteQuery(Channel).delete_batch(channel_ids, using)
+
+    job.channels += deleted['channels']
+    job.contents += deleted['contents']
+    job.files += deleted['files']
+
+    cache.delete_many([
+        key for pk in channel_ids
+        for key in (Channel.rating_cache_key(pk), singleflight.stale_key(Channel.rating_cache_key(pk)))
+    ])
+    return files
+
+
+def delete_subtree(job: ChannelDeletionJob) -> None:
+    """
+    Deletes the channel of `job` and its subtree, leaf-first, saving the progress in `job`.
+    """
+    pk = job.channel_id
+    using = router.db_for_write(Channel)
+    parent_id = Channel.objects.using(using).filter(pk=pk).values_list('parent_id', flat=True).first()
+
+    job.status = Status.RUNNING
+    job.save()
+    with ThreadPoolExecutor(max_workers=settings.CHANNEL_DELETION_FILE_WORKERS) as executor:
+        for level in reversed(_levels(pk)):
+            for chunk in _chunks(level, settings.CHANNEL_DELETION_BATCH_SIZE):
+                _delete_files(_delete_batch(chunk, job, using), executor)
+                job.save()
+
+    tree.bump_version()
+    if parent_id is not None:
+        Channel(pk=parent_id).invalidate_cache()
+        Channel.refresh_indexed_rating(parent_id)
+    job.status = Status.DONE
+    job.save()
+
+
+def _run(job: ChannelDeletionJob) -> None:
+    try:
+        delete_subtree(job)
+    except Exception as error:
+        logger.exception("Deletion of channel %d failed", job.channel_id)
+        job.status = Status.FAILED
+        job.error = str(error) or type(error).__name__
+        job.save()
+
+
+def start_subtree_deletion(pk: int) -> ChannelDeletionJob:
+    """
+    Starts the deletion of the channel `pk` and its subtree and returns its job.
+    It runs in a background thread unless `settings.CHANNEL_DELETION_EAGER`.
+    """
+    job = ChannelDeletionJob.objects.create(channel_id=pk)
+
+    if settings.CHANNEL_DELETION_EAGER:
+        _run(job)
+        return job
+
+    def run() -> None:
+        # The thread starts with a fresh context, not pinned to the primary like the request.
+        try:
+            with use_primary():
+                _run(copy.copy(job))
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, name=f'channel-deletion-{pk}', daemon=True).start()
+    return job
@@ -0,0 +1,457 @@
+"""
+Load testing by replaying request mixes against the application.
+
+Requests are either recorded, one JSON object per line as
+
+    {"method": "POST", "path": "/channels/1/content/", "body": {"metadata": {}, "rating": "5.00"}}
+
+with `body` as JSON, or `body_base64` and `content_type` for raw bodies, or
+generated from the data in the database: lists, channel and content details,
+content creations, file uploads and content deletions.
+
+They are sent in-process to `ImmflyBackend.wsgi.application` or
+`asgi.application`, which also counts the database queries of each request,
+or over HTTP to a running server. In closed-loop mode a fixed number of
+workers send the next request as soon as they get a response; in open-loop
+mode requests start at a fixed rate whatever the response times, and their
+latency counts from the time they were due, to find the saturation point.
+
+Writes go to the configured database and storage, use a copy of them.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import http.client
+import io
+import itertools
+import json
+import math
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from random import Random
+from typing import Any
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.db import connections
+from django.urls import Resolver404, resolve, reverse
+
+from content.models import Content
+from content.tree import channel_tree
+
+DEFAULT_MIX = {
+    'list': 20,
+    'channel': 30,
+    'content': 25,
+    'create': 10,
+    'upload': 5,
+    'delete': 10,
+}
+
+# Requests sent again once all have been sent, the others, as deletes, would fail.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT')
+
+# Transports send a request and return its status code, 0 if it failed.
+Transport = Callable[['RequestSpec'], int]
+
+
+def endpoint_name(method: str, path: str) -> str:
+    try:
+        name = resolve(urlsplit(path).path).url_name or path
+    except Resolver404:
+        name = path
+    return f"{method} {name}"
+
+
+@dataclass(frozen=True)
+class RequestSpec:
+    method: str
+    path: str
+    body: bytes = b''
+    content_type: str | None = None
+    endpoint: str = ''
+
+    @classmethod
+    def create(cls, method: str, path: str, body: bytes = b'', content_type: str | None = None) -> RequestSpec:
+        return cls(method.upper(), path, body, content_type, endpoint_name(method.upper(), path))
+
+    @classmethod
+    def json(cls, method: str, path: str, data: Any) -> RequestSpec:
+        return cls.create(method, path, json.dumps(data).encode(), 'application/json')
+
+
+def load_requests(lines: Iterable[str]) -> list[RequestSpec]:
+    """
+    Returns the requests of a recording, skipping blank lines.
+    """
+    specs = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if 'body' in record:
+            specs.append(RequestSpec.json(record['method'], record['path'], record['body']))
+        else:
+            specs.append(RequestSpec.create(
+                record['method'],
+                record['path'],
+                base64.b64decode(record.get('body_base64', '')),
+                record.get('content_type'),
+            ))
+    return specs
+
+
+def generate_requests(
+    count: int,
+    mix: dict[str, int] | None = None,
+    seed: int = 0,
+    upload_size: int = 64 * 1024,
+) -> list[RequestSpec]:
+    """
+    Returns `count` requests with the proportions of `mix` on the channels and contents in the
+    database. Each content is deleted once at most and never requested after being deleted.
+    """
+    random = Random(seed)
+    tree = channel_tree()
+    channels = list(tree.ids)
+    leaves = [pk for pk in channels if not tree.has_subchannels(pk)]
+    contents = list(Content.objects.order_by('pk').values_list('pk', flat=True))
+    random.shuffle(contents)
+
+    available = {
+        'list': True,
+        'channel': bool(channels),
+        'content': bool(contents),
+        'create': bool(leaves),
+        'upload': bool(contents),
+        'delete': bool(contents),
+    }
+    weights = {kind: weight for kind, weight in (mix or DEFAULT_MIX).items() if available.get(kind)}
+    kinds = random.choices(list(weights), list(weights.values()), k=count) if weights else []
+
+    # Deleted contents are kept apart from the ones the other requests use,
+    # the deletes over the contents available are replaced by other requests.
+    deletes = min(kinds.count('delete'), len(contents) - 1)
+    deleted, contents = contents[:deletes], contents[deletes:]
+    others = {kind: weight for kind, weight in weights.items() if kind != 'delete'} or {'list': 1}
+    kinds = [kind for kind in kinds if kind != 'delete'] + ['delete'] * deletes
+    kinds += random.choices(list(others), list(others.values()), k=count - len(kinds))
+    random.shuffle(kinds)
+
+    specs = []
+    for index, kind in enumerate(kinds):
+        if kind == 'list':
+            specs.append(RequestSpec.create('GET', reverse('channel-list')))
+        elif kind == 'channel':
+            specs.append(RequestSpec.create('GET', reverse('channel-detail', kwargs={'pk': random.choice(channels)})))
+        elif kind == 'content':
+            specs.append(RequestSpec.create('GET', reverse('content-detail', kwargs={'pk': random.choice(contents)})))
+        elif kind == 'create':
+            specs.append(RequestSpec.json(
+                'POST',
+                reverse('content-creation', kwargs={'pk': random.choice(leaves)}),
+                {'metadata': {'title': f'Load test {index}'}, 'rating': f'{random.uniform(0, 10):.2f}'},
+            ))
+        elif kind == 'upload':
+            specs.append(RequestSpec.create(
+                'PUT',
+                reverse('content-files', kwargs={'pk': random.choice(contents), 'filename': f'loadtest-{index}.bin'}),
+                random.randbytes(upload_size),
+                'application/octet-stream',
+            ))
+        elif kind == 'delete':
+            specs.append(RequestSpec.create('DELETE', reverse('content-detail', kwargs={'pk': deleted.pop()})))
+    return specs
+
+
+def wsgi_transport(application: Callable[..., Iterable[bytes]], host: str = 'localhost') -> Transport:
+    """
+    Sends the requests to a WSGI `application` in the calling thread.
+    """
+    def send(spec: RequestSpec) -> int:
+        url = urlsplit(spec.path)
+        environ = {
+            'REQUEST_METHOD': spec.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': host,
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_LENGTH': str(len(spec.body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(spec.body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if spec.content_type:
+            environ['CONTENT_TYPE'] = spec.content_type
+
+        status = ''
+
+        def start_response(response_status: str, headers: list[tuple[str, str]], exc_info: Any = None) -> None:
+            nonlocal status
+            status = response_status
+
+        response = application(environ, start_response)
+        try:
+            for _chunk in response:
+                pass
+        finally:
+            close = getattr(response, 'close', None)
+            if close is not None:
+                close()
+        return int(status.split(' ', 1)[0])
+
+    return send
+
+
+def asgi_transport(application: Callable[..., Any], host: str = 'localhost') -> Transport:
+    """
+    Sends the requests to an ASGI `application` from the calling thread.
+    """
+    async def request(spec: RequestSpec) -> int:
+        url = urlsplit(spec.path)
+        headers = [(b'host', host.encode()), (b'content-length', str(len(spec.body)).encode())]
+        if spec.content_type:
+            headers.append((b'content-type', spec.content_type.encode()))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': spec.method,
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode(),
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': (host, 80),
+        }
+        status = 0
+        sent = False
+        finished = asyncio.Event()
+
+        async def receive() -> dict[str, Any]:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': spec.body, 'more_body': False}
+            # The client stays connected until the whole response is sent.
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message: dict[str, Any]) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        await application(scope, receive, send)
+        finished.set()
+        return status
+
+    return async_to_sync(request)
+
+
+def http_transport(base_url: str) -> Transport:
+    """
+    Sends the requests to a server over HTTP, with a keep-alive connection per thread.
+    """
+    url = urlsplit(base_url)
+    local = threading.local()
+
+    def send(spec: RequestSpec) -> int:
+        headers = {'Content-Length': str(len(spec.body))}
+        if spec.content_type:
+            headers['Content-Type'] = spec.content_type
+        for _attempt in range(2):
+            if getattr(local, 'connection', None) is None:
+                local.connection = http.client.HTTPConnection(url.hostname or 'localhost', url.port or 80, timeout=60)
+            try:
+                local.connection.request(spec.method, url.path.rstrip('/') + spec.path, body=spec.body, headers=headers)
+                response = local.connection.getresponse()
+                response.read()
+                return int(response.status)
+            except (OSError, http.client.HTTPException):
+                # Reconnects once, the server may have closed an idle connection.
+                local.connection.close()
+                local.connection = None
+        return 0
+
+    return send
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    queries: int = 0
+
+    def percentile(self, percent: float) -> float:
+        """
+        Latency under which are `percent` of the requests, by nearest rank.
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        return latencies[max(0, math.ceil(percent / 100 * len(latencies)) - 1)]
+
+
+@dataclass
+class LoadTestReport:
+    elapsed: float
+    count_queries: bool
+    endpoints: dict[str, EndpointStats] = field(default_factory=dict)
+
+    def add(self, endpoint: str, status: int, latency: float, queries: int) -> None:
+        stats = self.endpoints.setdefault(endpoint, EndpointStats())
+        stats.latencies.append(latency)
+        stats.queries += queries
+        # Failed requests, client and server errors, including the shed ones.
+        if not 200 <= status < 400:
+            stats.errors += 1
+
+    def rows(self) -> list[dict[str, Any]]:
+        """
+        Returns the results of each endpoint and of all of them, last.
+        """
+        total = EndpointStats()
+        for stats in self.endpoints.values():
+            total.latencies += stats.latencies
+            total.errors += stats.errors
+            total.queries += stats.queries
+
+        return [
+            {
+                'endpoint': name,
+                'requests': len(stats.latencies),
+                'throughput': len(stats.latencies) / self.elapsed if self.elapsed else 0.0,
+                'p50': stats.percentile(50),
+                'p90': stats.percentile(90),
+                'p99': stats.percentile(99),
+                'error_rate': stats.errors / len(stats.latencies) if stats.latencies else 0.0,
+                'queries': stats.queries if self.count_queries else None,
+            }
+            for name, stats in [*sorted(self.endpoints.items()), ('total', total)]
+        ]
+
+
+def replay(specs: Sequence[RequestSpec]) -> Iterator[RequestSpec]:
+    """
+    Yields `specs` and then, over and over, only the idempotent ones.
+    """
+    yield from specs
+    idempotent = [spec for spec in specs if spec.method in IDEMPOTENT_METHODS]
+    if idempotent:
+        yield from itertools.cycle(idempotent)
+
+
+def _send(transport: Transport, spec: RequestSpec, count_queries: bool) -> tuple[int, int]:
+    queries = 0
+
+    def count(execute: Callable[..., Any], *args: Any) -> Any:
+        nonlocal queries
+        queries += 1
+        return execute(*args)
+
+    with ExitStack() as stack:
+        if count_queries:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count))
+        try:
+            status = transport(spec)
+        except Exception:
+            status = 0
+    return status, queries
+
+
+def run_load_test(
+    specs: Sequence[RequestSpec],
+    transport: Transport,
+    concurrency: int = 8,
+    duration: float | None = None,
+    total: int | None = None,
+    rate: float | None = None,
+    count_queries: bool = True,
+) -> LoadTestReport:
+    """
+    Sends `specs`, and then their idempotent ones over and over, for `duration` seconds or
+    until `total` requests are sent, whatever comes first, and returns the results.
+
+    Without `rate`, `concurrency` workers send each request after the response to their
+    previous one (closed loop); a single one runs in the calling thread. With `rate`,
+    requests start at `rate` per second (open loop) with up to `concurrency` in flight,
+    and their latency includes the time they wait for a worker.
+    """
+    if not specs or (duration is None and total is None):
+        raise ValueError("Load tests need requests and a duration or a total of requests")
+
+    lock = threading.Lock()
+    sequence = replay(specs)
+    sent = itertools.count()
+    start = time.monotonic()
+    deadline = start + duration if duration is not None else math.inf
+    report = LoadTestReport(elapsed=0.0, count_queries=count_queries)
+
+    def record(spec: RequestSpec, status: int, started: float, queries: int) -> None:
+        latency = time.monotonic() - started
+        with lock:
+            report.add(spec.endpoint, status, latency, queries)
+
+    if rate:
+        def run(spec: RequestSpec, due: float) -> None:
+            status, queries = _send(transport, spec, count_queries)
+            record(spec, status, due, queries)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for index, spec in enumerate(sequence):
+                due = start + index / rate
+                if due >= deadline or (total is not None and index >= total):
+                    break
+                time.sleep(max(0.0, due - time.monotonic()))
+                executor.submit(run, spec, due)
+    else:
+        def worker() -> None:
+            while True:
+                with lock:
+                    index = next(sent)
+                    next_spec = next(sequence, None)
+                if next_spec is None:
+                    return
+                spec = next_spec
+                if time.monotonic() >= deadline or (total is not None and index >= total):
+                    return
+                started = time.monotonic()
+                status, queries = _send(transport, spec, count_queries)
+                record(spec, status, started, queries)
+
+        def thread_worker() -> None:
+            try:
+                worker()
+            finally:
+                connections.close_all()
+
+        if concurrency == 1:
+            worker()
+        else:
+            threads = [threading.Thread(target=thread_worker, name=f'loadtest-{index}') for index in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    report.elapsed = time.monotonic() - start
+    return report
@@ -0,0 +1,83 @@
+from collections.abc import Callable
+from typing import Any
+
+from django.core.management import CommandParser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from content.models import Channel, Content, ContentFile
+from content.renderers import FastJSONRenderer
+from content.representations import CHANNEL_FIELDS, CONTENT_FIELDS, channel_representations, content_representation
+from content.serializers import ChannelSerializer, ContentSerializer
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the serializers against the read-optimized representations on a temporary dataset'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--seconds', type=float, default=2.0, help='Duration of each run (default: 2)')
+        parser.add_argument('--channels', type=int, default=50, help='Root channels listed (default: 50)')
+        parser.add_argument('--files', type=int, default=20, help='Files of the content (default: 20)')
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        # The dataset is created in a transaction rolled back at the end.
+        with transaction.atomic():
+            channels = Channel.objects.bulk_create(
+                Channel(title=f'Channel {index}', language='en') for index in range(kwargs['channels'])
+            )
+            subchannels = Channel.objects.bulk_create(
+                Channel(parent=channel, title=f'{channel.title} - {index}', language='en')
+                for channel in channels for index in range(3)
+            )
+            content = Content.objects.create(channel=subchannels[0], metadata={'title': 'Content'}, rating=5)
+            ContentFile.objects.bulk_create(
+                ContentFile(content=content, file=f'contents/{content.pk}/file {index}.mp4')
+                for index in range(kwargs['files'])
+            )
+            roots = Channel.objects.filter(parent=None)
+            # Rendered on their own too, so the cost of the renderer isn't hidden by the queries.
+            channel_data = channel_representations(roots.values(*CHANNEL_FIELDS))
+            content_data = content_representation(Content.objects.values(*CONTENT_FIELDS).get(pk=content.pk))
+
+            results = [
+                self._run('channel list, serializers', kwargs['seconds'], lambda: JSONRenderer().render(
+                    ChannelSerializer(roots, many=True, context={'request': None}).data
+                )),
+                self._run('channel list, representations', kwargs['seconds'], lambda: FastJSONRenderer().render(
+                    channel_representations(roots.values(*CHANNEL_FIELDS))
+                )),
+                self._run('content detail, serializers', kwargs['seconds'], lambda: JSONRenderer().render(
+                    ContentSerializer(Content.objects.get(pk=content.pk), context={'request': None}).data
+                )),
+                self._run('content detail, representations', kwargs['seconds'], lambda: FastJSONRenderer().render(
+                    content_representation(Content.objects.values(*CONTENT_FIELDS).get(pk=content.pk))
+                )),
+                self._run('channel list, JSONRenderer', kwargs['seconds'], lambda: JSONRenderer().render(channel_data)),
+                self._run('channel list, FastJSONRenderer', kwargs['seconds'], lambda: FastJSONRenderer().render(
+                    channel_data
+                )),
+                self._run('content detail, JSONRenderer', kwargs['seconds'], lambda: JSONRenderer().render(content_data)),
+                self._run('content detail, FastJSONRenderer', kwargs['seconds'], lambda: FastJSONRenderer().render(
+                    content_data
+                )),
+            ]
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Speedup: channel list x{results[1] / results[0]:.2f}, content detail x{results[3] / results[2]:.2f}'
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Renderer speedup: channel list x{results[5] / results[4]:.2f}, content detail x{results[7] / results[6]:.2f}'
+        ))
+
+    def _run(self, name: str, seconds: float, render: Callable[[], bytes]) -> float:
+        render()
+        runs = 0
+        start = time.perf_counter()
+        while (elapsed := time.perf_counter() - start) < seconds:
+            render()
+            runs += 1
+        throughput = runs / elapsed
+        self.stdout.write(f'{name:>32}: {throughput:10.1f} renders/s')
+        return throughput
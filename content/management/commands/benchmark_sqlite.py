@@ -0,0 +1,132 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management import CommandParser
+from django.core.management.base import BaseCommand
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+READ_QUERY = 'SELECT id, title FROM channel WHERE id = ?'
+RATING_QUERY = 'SELECT AVG(rating) FROM content WHERE channel_id = ?'
+WRITE_QUERY = 'INSERT INTO content (channel_id, rating, metadata) VALUES (?, ?, ?)'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent SQLite reads and writes with default settings and with SQLITE_PRAGMAS'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run (default: 5)')
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads (default: 8)')
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads (default: 2)')
+        parser.add_argument('--channels', type=int, default=1000, help='Channels in the dataset (default: 1000)')
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        profiles: list[tuple[str, dict[str, str | int], bool]] = [
+            # Django defaults: rollback journal and a new connection per request.
+            ('default', {}, False),
+            ('tuned', settings.SQLITE_PRAGMAS, True),
+        ]
+
+        results = {}
+        for name, pragmas, persistent in profiles:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'benchmark.sqlite3')
+                self._create_dataset(path, kwargs['channels'])
+                results[name] = self._run(
+                    path, pragmas, persistent,
+                    kwargs['seconds'], kwargs['readers'], kwargs['writers'], kwargs['channels']
+                )
+            reads, writes, errors = results[name]
+            self.stdout.write(
+                f"{name:>8}: {reads / kwargs['seconds']:10.1f} reads/s"
+                f" {writes / kwargs['seconds']:10.1f} writes/s {errors:6d} busy errors"
+            )
+
+        baseline, tuned = results['default'], results['tuned']
+        self.stdout.write(self.style.SUCCESS(
+            f"Throughput speedup: reads x{tuned[0] / max(baseline[0], 1):.2f},"
+            f" writes x{tuned[1] / max(baseline[1], 1):.2f}"
+        ))
+
+    def _create_dataset(self, path: str, channels: int) -> None:
+        connection = sqlite3.connect(path)
+        connection.executescript(
+            'CREATE TABLE channel (id INTEGER PRIMARY KEY, title TEXT NOT NULL);'
+            'CREATE TABLE content ('
+            ' id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL, rating REAL NOT NULL, metadata TEXT NOT NULL'
+            ');'
+            'CREATE INDEX content_channel_id ON content (channel_id);'
+        )
+        connection.executemany('INSERT INTO channel (id, title) VALUES (?, ?)', (
+            (pk, f'Channel {pk}') for pk in range(1, channels + 1)
+        ))
+        connection.executemany(WRITE_QUERY, (
+            (random.randint(1, channels), random.uniform(0, 10), '{}') for _ in range(channels * 10)
+        ))
+        connection.commit()
+        connection.close()
+
+    def _run(
+        self,
+        path: str,
+        pragmas: dict[str, str | int],
+        persistent: bool,
+        seconds: float,
+        readers: int,
+        writers: int,
+        channels: int,
+    ) -> tuple[int, int, int]:
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def connect() -> sqlite3.Connection:
+            connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            for pragma, value in pragmas.items():
+                connection.execute(f"PRAGMA {pragma} = {value}")
+            return connection
+
+        def worker(kind: str) -> None:
+            done = errors = 0
+            connection = connect() if persistent else None
+            while time.monotonic() < deadline:
+                current = connection or connect()
+                channel = random.randint(1, channels)
+                try:
+                    if kind == 'reads':
+                        current.execute(READ_QUERY, (channel,)).fetchone()
+                        current.execute(RATING_QUERY, (channel,)).fetchone()
+                    else:
+                        current.execute('BEGIN IMMEDIATE')
+                        current.execute(WRITE_QUERY, (channel, random.uniform(0, 10), '{}'))
+                        current.execute('COMMIT')
+                    done += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if current.in_transaction:
+                        current.execute('ROLLBACK')
+                finally:
+                    if connection is None:
+                        current.close()
+            if connection is not None:
+                connection.close()
+            with lock:
+                counts[kind] += done
+                counts['errors'] += errors
+
+        threads = [
+            threading.Thread(target=worker, args=(kind,))
+            for kind, amount in (('reads', readers), ('writes', writers))
+            for _ in range(amount)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return counts['reads'], counts['writes'], counts['errors']
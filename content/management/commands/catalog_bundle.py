@@ -0,0 +1,83 @@
+from typing import Any
+
+from django.core.management import CommandParser
+from django.core.management.base import BaseCommand, CommandError
+from content.bundles import (
+    DEFAULT_CHUNK_SIZE, BundleError, build_bundle, build_delta, apply_delta, verify_bundle
+)
+from content.models import Channel
+import time
+
+
+class Command(BaseCommand):
+    help = 'Build, diff, apply and verify offline catalog bundles of a channel subtree'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        build = subparsers.add_parser('build', help='Build the bundle of a channel subtree')
+        build.add_argument('channel', type=int, help='Root channel of the bundle')
+        build.add_argument('output', help='The output bundle file')
+        build.add_argument('--version', dest='bundle_version', help='Bundle version (default: UTC timestamp)')
+        build.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Chunk size in bytes used to diff media (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        build.add_argument('--workers', type=int, default=4, help='Parallel workers (default: 4)')
+
+        delta = subparsers.add_parser('delta', help='Build a delta between two bundles')
+        delta.add_argument('base', help='The bundle the delta applies to')
+        delta.add_argument('target', help='The bundle the delta produces')
+        delta.add_argument('output', help='The output delta file')
+
+        apply = subparsers.add_parser('apply', help='Rebuild a bundle from its base and a delta')
+        apply.add_argument('base', help='The bundle the delta applies to')
+        apply.add_argument('delta', help='The delta file')
+        apply.add_argument('output', help='The output bundle file')
+        apply.add_argument('--workers', type=int, default=4, help='Parallel workers (default: 4)')
+
+        verify = subparsers.add_parser('verify', help='Verify the integrity of a bundle')
+        verify.add_argument('bundle', help='The bundle file')
+        verify.add_argument('--workers', type=int, default=4, help='Parallel workers (default: 4)')
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        start_time = time.time()
+        action = kwargs['action']
+
+        try:
+            if action == 'build':
+                try:
+                    channel = Channel.objects.get(pk=kwargs['channel'])
+                except Channel.DoesNotExist:
+                    raise CommandError(f"Channel {kwargs['channel']} does not exist")
+                manifest = build_bundle(
+                    channel,
+                    kwargs['output'],
+                    version=kwargs['bundle_version'],
+                    chunk_size=kwargs['chunk_size'],
+                    workers=kwargs['workers'],
+                )
+                message = (
+                    f"Built bundle {manifest['version']} with {len(manifest['channels'])} channels"
+                    f" and {len(manifest['files'])} files to {kwargs['output']}"
+                )
+            elif action == 'delta':
+                delta = build_delta(kwargs['base'], kwargs['target'], kwargs['output'])
+                message = (
+                    f"Built delta {delta['base']['version']} -> {delta['target']['version']}"
+                    f" with {len(delta['files'])} changed and {len(delta['removed'])} removed files"
+                    f" to {kwargs['output']}"
+                )
+            elif action == 'apply':
+                manifest = apply_delta(kwargs['base'], kwargs['delta'], kwargs['output'], workers=kwargs['workers'])
+                message = f"Rebuilt and verified bundle {manifest['version']} to {kwargs['output']}"
+            else:
+                manifest = verify_bundle(kwargs['bundle'], workers=kwargs['workers'])
+                message = f"Bundle {manifest['version']} is valid"
+        except BundleError as error:
+            raise CommandError(str(error))
+
+        elapsed_time = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f'{message} in {elapsed_time:.3f}s'))
@@ -2,7 +2,9 @@ from typing import Any
 
 from django.core.management import CommandParser
 from django.core.management.base import BaseCommand
+from django.db.models import F
 from content.models import Channel
+from content.ratings import batch_ratings
 import time
 import csv
 
@@ -27,22 +29,21 @@ class Command(BaseCommand):
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             writer.writeheader()
 
-            channels = sorted(
-                (
-                    (channel.title, channel.rating())
-                    for channel
-                    in Channel.objects.prefetch_related(
-                        'contents', 'subchannels'
-                    ).only('title')
-                ),
-                key=lambda v: v[1] or 0,
-                reverse=True
+            # Streamed in rating order from the `indexed_rating` index, channels
+            # without rating last as they were sorted as zero, but written with
+            # the exact rating, as `rating()`, not the rounded indexed one.
+            ratings = batch_ratings()
+            channels = (
+                Channel.objects
+                .order_by(F('indexed_rating').desc(nulls_last=True), 'pk')
+                .values_list('pk', 'title')
+                .iterator(chunk_size=2000)
             )
 
-            for (title, rating) in channels:
+            for (pk, title) in channels:
                 writer.writerow({
                     'Channel Title': title,
-                    'Rating': rating
+                    'Rating': ratings.get(pk)
                 })
 
         elapsed_time = time.time() - start_time
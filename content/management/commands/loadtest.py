@@ -0,0 +1,92 @@
+from typing import Any
+
+from django.core.management import CommandParser
+from django.core.management.base import BaseCommand, CommandError
+from content.loadtest import (
+    DEFAULT_MIX, Transport, asgi_transport, generate_requests, http_transport, load_requests, run_load_test,
+    wsgi_transport
+)
+import json
+
+
+class Command(BaseCommand):
+    help = 'Replay recorded or generated requests against the application and report per-endpoint results'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--target',
+            default='wsgi',
+            help="'wsgi' or 'asgi' to run in-process, or the URL of a running server (default: wsgi)"
+        )
+        parser.add_argument('--requests', help='JSON Lines file of recorded requests (default: generated)')
+        parser.add_argument('--generate', type=int, default=1000, help='Requests to generate (default: 1000)')
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{kind}={weight}' for kind, weight in DEFAULT_MIX.items()),
+            help='Weights of the generated requests (default: %(default)s)'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated requests (default: 0)')
+        parser.add_argument('--upload-size', type=int, default=64 * 1024, help='Bytes per upload (default: 65536)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent workers (default: 8)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run (default: 10)')
+        parser.add_argument('--total', type=int, help='Stop after this many requests')
+        parser.add_argument('--rate', type=float, help='Open loop: requests started per second')
+        parser.add_argument('--host', default='localhost', help='Host header of in-process requests')
+        parser.add_argument('--json', dest='json_file', help='Also write the results to this JSON file')
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        if kwargs['requests']:
+            with open(kwargs['requests']) as lines:
+                specs = load_requests(lines)
+        else:
+            try:
+                mix = {kind: int(weight) for kind, weight in (item.split('=') for item in kwargs['mix'].split(','))}
+            except ValueError:
+                raise CommandError(f"Invalid mix: {kwargs['mix']}")
+            specs = generate_requests(kwargs['generate'], mix, kwargs['seed'], kwargs['upload_size'])
+        if not specs:
+            raise CommandError('No requests to send')
+
+        transport: Transport
+        target = kwargs['target']
+        if target == 'wsgi':
+            from ImmflyBackend.wsgi import application
+            transport = wsgi_transport(application, kwargs['host'])
+        elif target == 'asgi':
+            from ImmflyBackend.asgi import application as asgi_application
+            transport = asgi_transport(asgi_application, kwargs['host'])
+        else:
+            transport = http_transport(target)
+
+        mode = f"open loop at {kwargs['rate']} requests/s" if kwargs['rate'] else 'closed loop'
+        self.stdout.write(f"Sending {len(specs)} requests to {target}, {mode}, {kwargs['concurrency']} workers")
+        report = run_load_test(
+            specs,
+            transport,
+            concurrency=kwargs['concurrency'],
+            duration=kwargs['duration'],
+            total=kwargs['total'],
+            rate=kwargs['rate'],
+            count_queries=target in ('wsgi', 'asgi'),
+        )
+
+        rows = report.rows()
+        self.stdout.write(
+            f"{'endpoint':<28} {'requests':>8} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}"
+            f" {'errors':>7} {'queries':>8}"
+        )
+        for row in rows:
+            queries = '-' if row['queries'] is None else str(row['queries'])
+            self.stdout.write(
+                f"{row['endpoint']:<28} {row['requests']:>8} {row['throughput']:>9.1f}"
+                f" {row['p50'] * 1000:>9.1f} {row['p90'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f}"
+                f" {row['error_rate']:>7.1%} {queries:>8}"
+            )
+
+        if kwargs['json_file']:
+            with open(kwargs['json_file'], 'w') as json_file:
+                json.dump({'elapsed': report.elapsed, 'endpoints': rows}, json_file, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {rows[-1]['requests']} requests in {report.elapsed:.2f}s, {rows[-1]['throughput']:.1f} requests/s"
+        ))
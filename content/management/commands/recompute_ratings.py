@@ -0,0 +1,44 @@
+from typing import Any
+
+from django.core.management import CommandParser
+from django.core.management.base import BaseCommand
+from content.db import use_primary
+from content.models import Channel
+from content.ratings import batch_ratings, indexed_value
+import time
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating of every channel in batch and audit the indexed ratings'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Update the indexed ratings that are out of date'
+        )
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        start_time = time.time()
+
+        ratings = batch_ratings()
+        computed_time = time.time() - start_time
+
+        # Audited on the primary, where they're fixed, a replica may lag behind.
+        with use_primary():
+            stale = [
+                Channel(pk=pk, indexed_rating=expected)
+                for pk, indexed in Channel.objects.values_list('pk', 'indexed_rating').iterator(chunk_size=10000)
+                if (expected := indexed_value(ratings.get(pk))) != indexed
+            ]
+        for channel in stale:
+            self.stdout.write(f'Channel {channel.pk} indexed rating is out of date, expected {channel.indexed_rating}')
+
+        if kwargs['fix'] and stale:
+            Channel.objects.bulk_update(stale, ['indexed_rating'], batch_size=1000)
+
+        elapsed_time = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {len(ratings)} channel ratings in {computed_time:.3f}s,'
+            f' {len(stale)} indexed ratings {"fixed" if kwargs["fix"] else "out of date"} in {elapsed_time:.3f}s'
+        ))
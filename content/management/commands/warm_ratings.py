@@ -0,0 +1,40 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management import CommandParser
+from django.core.management.base import BaseCommand
+from content.warmup import warm_rating_cache
+import time
+
+
+class Command(BaseCommand):
+    help = 'Fill the channel rating cache, prioritizing roots and most read channels'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=settings.RATING_WARMUP_RATE,
+            help=f'Channels written per second, 0 to not throttle (default: {settings.RATING_WARMUP_RATE})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RATING_WARMUP_BATCH_SIZE,
+            help=f'Channels written per batch (default: {settings.RATING_WARMUP_BATCH_SIZE})'
+        )
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        start_time = time.time()
+
+        def progress(done: int, total: int) -> None:
+            if kwargs['verbosity'] > 1:
+                self.stdout.write(f'{done}/{total} channels')
+
+        result = warm_rating_cache(rate=kwargs['rate'], batch_size=kwargs['batch_size'], progress=progress)
+
+        elapsed_time = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'Warmed up {result.warmed} channel ratings in {elapsed_time:.3f}s,'
+            f' {result.cached} of the {result.channels} prioritized are cached'
+        ))
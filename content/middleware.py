@@ -0,0 +1,195 @@
+import threading
+import time
+from collections.abc import Callable
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from content.db import use_primary
+
+PRIMARY_PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PrimaryPinningMiddleware:
+    """
+    Keeps the reads of a client on the primary database for `settings.PRIMARY_PIN_SECONDS`
+    after its last write, so it reads its own writes while replicas catch up.
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        writes = request.method not in SAFE_METHODS
+        with use_primary(writes or PRIMARY_PIN_COOKIE in request.COOKIES):
+            response = self.get_response(request)
+
+        if writes:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE,
+                '1',
+                max_age=settings.PRIMARY_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
+
+
+CHEAP_READS = 'cheap_reads'
+EXPENSIVE_READS = 'expensive_reads'
+UPLOADS = 'uploads'
+BULK_WRITES = 'bulk_writes'
+
+# Reads that compute channel ratings, cold ratings recurse over whole subtrees.
+EXPENSIVE_READ_ROUTES = {'channel-list', 'channel-top', 'channel-detail'}
+UPLOAD_ROUTES = {'content-files'}
+# Never shed, to see what's going on under overload.
+EXEMPT_ROUTES = {'admission-metrics'}
+
+
+def route_class(url_name: str | None, method: str | None) -> str:
+    if method in SAFE_METHODS:
+        return EXPENSIVE_READS if url_name in EXPENSIVE_READ_ROUTES else CHEAP_READS
+    return UPLOADS if url_name in UPLOAD_ROUTES else BULK_WRITES
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with a bounded wait queue, adapted to the observed latency.
+
+    The limit grows by one every `limit` requests served under `target_latency`
+    seconds and shrinks by `DECREASE` when they're slower (additive increase,
+    multiplicative decrease), at most once per `target_latency` so the slow
+    requests of a single overload don't take it down to `min_limit` at once.
+    The limit is a float so it can grow and shrink gradually, but only
+    `capacity`, its integer part, requests are admitted at once.
+    """
+    DECREASE = 0.9
+
+    def __init__(
+        self,
+        limit: float,
+        min_limit: float,
+        max_limit: float,
+        queue: int,
+        queue_timeout: float,
+        target_latency: float,
+        retry_after: int,
+    ) -> None:
+        self.limit = float(limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.retry_after = retry_after
+
+        self._condition = threading.Condition()
+        self._decreased_at = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def capacity(self) -> int:
+        return int(self.limit)
+
+    def acquire(self) -> bool:
+        """
+        Takes a slot, waiting up to `queue_timeout` seconds if there's room in the queue.
+        """
+        with self._condition:
+            if self.in_flight >= self.capacity:
+                if self.waiting >= self.queue:
+                    self.rejected += 1
+                    return False
+
+                self.waiting += 1
+                self.queued += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self.in_flight < self.capacity, self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.timed_out += 1
+                    return False
+
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self, latency: float) -> None:
+        """
+        Frees a slot taken for a request served in `latency` seconds.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if latency <= self.target_latency:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif now - self._decreased_at >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.DECREASE)
+                self._decreased_at = now
+            self._condition.notify_all()
+
+    def snapshot(self) -> dict[str, float]:
+        with self._condition:
+            return {
+                'limit': round(self.limit, 2),
+                'capacity': self.capacity,
+                'in_flight': self.in_flight,
+                'queue_depth': self.waiting,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+
+# Limiters of the last `AdmissionControlMiddleware` created, for the metrics.
+limiters: dict[str, AdaptiveLimiter] = {}
+
+
+class AdmissionControlMiddleware:
+    """
+    Limits the concurrent requests of each route class of this process, see
+    `settings.ADMISSION_CONTROL`, so bursts of a class, e.g. uploads or cold
+    rating reads, can't take every worker thread. Requests over the limit wait
+    in a bounded queue and are answered with a 503 and `Retry-After` if it's
+    full or they don't get a slot in time.
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+        self.limiters = {
+            name: AdaptiveLimiter(**params) for name, params in settings.ADMISSION_CONTROL.items()
+        }
+        limiters.clear()
+        limiters.update(self.limiters)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            url_name = None
+        if url_name in EXEMPT_ROUTES:
+            return self.get_response(request)
+
+        limiter = self.limiters.get(route_class(url_name, request.method))
+        if limiter is None:
+            return self.get_response(request)
+
+        if not limiter.acquire():
+            response = JsonResponse({'detail': 'Server overloaded, retry later.'}, status=503)
+            response['Retry-After'] = str(limiter.retry_after)
+            return response
+
+        start = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            limiter.release(time.monotonic() - start)
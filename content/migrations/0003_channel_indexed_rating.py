@@ -0,0 +1,51 @@
+# Generated by Django 5.1.3 on 2026-10-19 04:09
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_indexed_rating(apps, schema_editor):
+    Channel = apps.get_model('content', 'Channel')
+    Content = apps.get_model('content', 'Content')
+
+    averages = dict(
+        Content.objects.order_by().values_list('channel_id').annotate(models.Avg('rating'))
+    )
+    children = defaultdict(list)
+    for pk, parent_id in Channel.objects.order_by('pk').values_list('pk', 'parent_id'):
+        children[parent_id].append(pk)
+
+    # Same rules as `Channel._rating()`, walked iteratively children first.
+    ratings = {}
+    stack = [(pk, False) for pk in children[None]]
+    while stack:
+        pk, expanded = stack.pop()
+        if pk in averages:
+            ratings[pk] = averages[pk]
+        elif not expanded:
+            stack.append((pk, True))
+            stack.extend((child, False) for child in children[pk])
+        else:
+            subratings = [ratings[child] for child in children[pk] if ratings[child]]
+            ratings[pk] = Decimal(sum(subratings) / len(subratings)) if subratings else None
+
+    channels = [Channel(pk=pk, indexed_rating=rating) for pk, rating in ratings.items() if rating is not None]
+    Channel.objects.bulk_update(channels, ['indexed_rating'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0002_alter_channel_picture_alter_contentfile_content_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='indexed_rating',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=4, null=True),
+        ),
+        migrations.RunPython(backfill_indexed_rating, migrations.RunPython.noop),
+    ]
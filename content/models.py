@@ -1,11 +1,20 @@
 from __future__ import annotations
+import uuid
+from collections.abc import Collection
 from decimal import Decimal
-from typing import cast, Any
+from typing import Self, cast, Any
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.cache import cache
-from django.db import models
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+from content import singleflight
+from content.db import use_primary
+from content.singleflight import Lookup
+from content.tree import UNKNOWN
 
 
 def channel_picture_path(instance: Channel, filename: str) -> str:
@@ -28,10 +37,23 @@ class Channel(models.Model):
         null=True,
         blank=True
     )
+    # Denormalized copy of `rating()` kept current by the signals, so
+    # channels can be ranked by rating directly in the database.
+    indexed_rating = models.DecimalField(
+        max_digits=4,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Parent before the last save, set by the signals to refresh the channels a channel leaves.
+    previous_parent_id: int | None = None
+
     def __str__(self) -> str:
         return self.title
 
@@ -46,38 +68,88 @@ class Channel(models.Model):
         super().save(*args, **kwargs)
 
     def rating(self) -> Decimal | None:
+        return self.rating_state().value
+
+    def rating_state(self) -> Lookup[Decimal | None]:
+        """
+        Returns the rating and whether it's stale: while another caller recomputes
+        an invalidated rating the previous one is returned, if still available.
+        """
         # Cache rating reduce time to half while the invalidation
         # ensures that the cache is always up to date.
-        cached_rating = cast(Decimal | None, cache.get(self._rating_cache_key()))
-        if cached_rating is not None:
-            return cached_rating
-        return self._cache_rating()
+        return singleflight.get_or_compute(
+            self._rating_cache_key(),
+            self._rating_state,
+            lock_timeout=settings.RATING_LOCK_TIMEOUT,
+            wait=settings.RATING_LOCK_WAIT
+        )
 
     def _cache_rating(self) -> Decimal | None:
-        rating = self._rating()
-        cache.set(self._rating_cache_key(), rating, timeout=None)
-        return rating
-
-    def _rating(self) -> Decimal | None:
-        if self.contents.exists():
-            return cast(Decimal, self.contents.aggregate(models.Avg('rating'))['rating__avg'])
-
-        subratings = [
-            subrating for subrating in (
-                subchannel.rating() for subchannel
-                in self.subchannels.prefetch_related('contents')
-            ) if subrating
-        ]
-
-        return Decimal(sum(subratings) / len(subratings)) if subratings else None
+        rating = self._rating_state()
+        if not rating.stale:
+            cache.set(self._rating_cache_key(), rating.value, timeout=None)
+        return rating.value
+
+    def _rating_state(self) -> Lookup[Decimal | None]:
+        """
+        Computes the rating, stale if the rating of any sub-channel was.
+        It reads from the primary, as the result is cached until invalidated,
+        and a lagging replica would cache a rating the invalidation already missed.
+        """
+        with use_primary():
+            if self.contents.exists():
+                return Lookup(cast(Decimal, self.contents.aggregate(models.Avg('rating'))['rating__avg']), False)
+
+            subratings = [subchannel.rating_state() for subchannel in self.subchannels.prefetch_related('contents')]
+        values = [subrating.value for subrating in subratings if subrating.value]
+
+        return Lookup(
+            Decimal(sum(values) / len(values)) if values else None,
+            any(subrating.stale for subrating in subratings)
+        )
 
     def _rating_cache_key(self) -> str:
-        return f"channel_rating_{self.pk}"
+        return self.rating_cache_key(self.pk)
+
+    @staticmethod
+    def rating_cache_key(pk: int) -> str:
+        return f"channel_rating_{pk}"
 
     def invalidate_cache(self) -> None:
-        cache.delete(self._rating_cache_key())
-        if self.parent:
-            self.parent.invalidate_cache()
+        keys = []
+        channel: Channel | None = self
+        while channel:
+            keys.append(channel._rating_cache_key())
+            channel = channel.parent
+        singleflight.invalidate(keys, stale_timeout=settings.RATING_STALE_TIMEOUT)
+
+    def descendants(self) -> models.QuerySet[Channel]:
+        """
+        Returns the channels of the subtree, walked by the database with a recursive query.
+        """
+        table = connection.ops.quote_name(Channel._meta.db_table)
+        return Channel.objects.filter(pk__in=RawSQL(
+            f"WITH RECURSIVE descendants(id) AS ("
+            f"SELECT id FROM {table} WHERE parent_id = %s"
+            f" UNION ALL SELECT channel.id FROM {table} channel"
+            f" JOIN descendants ON channel.parent_id = descendants.id"
+            f") SELECT id FROM descendants",
+            [self.pk]
+        ))
+
+    @classmethod
+    def refresh_indexed_rating(cls, pk: int | None) -> None:
+        """
+        Recomputes the rating of a channel and its ancestors, bottom-up, and stores it in `indexed_rating`.
+        Channels that no longer exist stop the walk, e.g. while a whole subtree is being deleted.
+        """
+        with use_primary():
+            while pk is not None:
+                channel = cls.objects.filter(pk=pk).only('parent').first()
+                if channel is None:
+                    return
+                cls.objects.filter(pk=pk).update(indexed_rating=channel._cache_rating())
+                pk = channel.parent_id
 
 
 class Content(models.Model):
@@ -95,6 +167,9 @@ class Content(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Channel as loaded from the database, so the signals know when a save moves the content.
+    loaded_channel_id: object = UNKNOWN
+
     def __str__(self) -> str:
         label = f"content {self.id}"
 
@@ -103,6 +178,12 @@ class Content(models.Model):
 
         return label
 
+    @classmethod
+    def from_db(cls, db: str | None, field_names: Collection[str], values: Collection[Any]) -> Self:
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_channel_id = instance.__dict__.get('channel_id', UNKNOWN)
+        return instance
+
     def clean(self) -> None:
         if self.channel and self.channel.subchannels.exists():
             raise ValidationError("Channel cannot have sub-channels and contents")
@@ -133,3 +214,30 @@ class ContentFile(models.Model):
 
     def __str__(self) -> str:
         return f"file {self.id} - {self.content}"
+
+
+class ChannelDeletionJob(models.Model):
+    """
+    Deletion of a channel subtree running in the background, see `content.deletion`.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Not a foreign key, the channel is gone once the job is done.
+    channel_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    channels = models.PositiveIntegerField(default=0)
+    contents = models.PositiveIntegerField(default=0)
+    files = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"deletion {self.id} of channel {self.channel_id} - {self.status}"
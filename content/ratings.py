@@ -0,0 +1,97 @@
+"""
+Batch computation of channel ratings.
+
+`Channel.rating()` walks the tree one channel at a time, two or three queries
+per channel. For full recomputes the tree is instead loaded into flat arrays
+with two queries, the averages of the channels with contents are reduced by
+the database in a single `GROUP BY`, and the ratings are propagated level by
+level from the deepest channels up to the roots.
+
+Ratings are kept as `Decimal` and children are summed in the same order and
+with the same expression as `Channel._rating_state()`, so the results are exactly
+those of `rating()`, including skipping children without rating (or with a
+rating of zero) and the precision of the decimal context.
+"""
+from __future__ import annotations
+
+from array import array
+from collections.abc import Mapping, Sequence
+from decimal import Decimal
+from typing import cast
+
+from django.db import models
+from django.db.backends.utils import format_number
+
+from content.db import use_primary
+from content.models import Channel, Content
+from content.tree import children_index
+
+
+def propagate_ratings(
+    ids: Sequence[int],
+    parent_ids: Sequence[int | None],
+    averages: Mapping[int, Decimal],
+) -> list[Decimal | None]:
+    """
+    Returns the rating of each channel of `ids`, which must be sorted, given the id of their
+    parents and the average rating of the contents of the channels that have contents.
+    """
+    position = {pk: index for index, pk in enumerate(ids)}
+    parents = [-1 if parent is None else position.get(parent, -1) for parent in parent_ids]
+
+    # Children of each channel, in id order as `subchannels` returns them, as
+    # slices `children[offsets[i]:offsets[i + 1]]` of a single flat array.
+    children, offsets = children_index(parents)
+
+    # Channels with contents take the average of their contents, the
+    # others whose children have been rated are reduced level by level
+    # from the deepest one, so children are always rated before parents.
+    ratings: list[Decimal | None] = list(map(averages.get, ids))
+    levels = [[index for index, parent in enumerate(parents) if parent < 0]]
+    while levels[-1]:
+        level: list[int] = []
+        for index in levels[-1]:
+            level += children[offsets[index]:offsets[index + 1]]
+        levels.append(level)
+
+    for level in reversed(levels):
+        for index in level:
+            start, end = offsets[index], offsets[index + 1]
+            if start == end or ratings[index] is not None:
+                continue
+            subratings = [rating for rating in map(ratings.__getitem__, children[start:end]) if rating]
+            if subratings:
+                ratings[index] = Decimal(sum(subratings) / len(subratings))
+
+    return ratings
+
+
+def batch_ratings() -> dict[int, Decimal | None]:
+    """
+    Returns the rating of every channel, as `Channel.rating()` would.
+    Like it, they're computed on the primary, as they're cached or indexed.
+    """
+    rows = Channel.objects.order_by('pk').values_list('pk', 'parent_id')
+    ids = array('q')
+    parent_ids: list[int | None] = []
+    with use_primary():
+        for pk, parent_id in rows.iterator(chunk_size=10000):
+            ids.append(pk)
+            parent_ids.append(parent_id)
+
+        averages: dict[int, Decimal] = dict(
+            Content.objects.order_by().values_list('channel_id').annotate(models.Avg('rating'))
+        )
+
+    return dict(zip(ids, propagate_ratings(ids, parent_ids, averages)))
+
+
+def indexed_value(rating: Decimal | None) -> Decimal | None:
+    """
+    Returns `rating` rounded as it's stored in `Channel.indexed_rating`.
+    """
+    if rating is None:
+        return None
+    field = Channel._meta.get_field('indexed_rating')
+    assert isinstance(field, models.DecimalField)
+    return Decimal(cast(str, format_number(rating, field.max_digits, field.decimal_places)))
@@ -0,0 +1,79 @@
+import math
+from typing import Any, Mapping, cast
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def has_diverging_floats(data: Any) -> bool:
+    """
+    Whether `data` has floats orjson writes unlike `json`: the non-finite ones
+    and those `repr()` writes in exponent notation, as `1e-07` for `1e-7`.
+    """
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value) or (value and not 1e-4 <= abs(value) < 1e16):
+                return True
+        elif isinstance(value, dict):
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+    return False
+
+
+class ExactFloats(dict[str, Any]):
+    """
+    Data `FastJSONRenderer` renders with `JSONRenderer`, see `exact_floats()`.
+    """
+
+
+def exact_floats(data: dict[str, Any], value: Any) -> dict[str, Any]:
+    """
+    Returns `data` marked to be rendered with `JSONRenderer` if `value`, the part of
+    it with arbitrary JSON as `Content.metadata`, has floats orjson writes differently.
+    """
+    return ExactFloats(data) if has_diverging_floats(value) else data
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders the same bytes as `JSONRenderer` with orjson.
+
+    Values orjson doesn't handle natively, or differently, as `Decimal` or
+    datetimes, go through DRF's encoder. Indented, ASCII only or not compact
+    output, data marked with `exact_floats()` and anything orjson can't
+    encode fall back to `JSONRenderer`. Only `Content.metadata` holds
+    arbitrary floats, so the rest of the data isn't checked for them.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(
+        self,
+        data: Any,
+        accepted_media_type: str | None = None,
+        renderer_context: Mapping[str, Any] | None = None
+    ) -> bytes:
+        if data is None:
+            return b''
+
+        if (
+            self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type or '', renderer_context or {}) is not None
+            or isinstance(data, ExactFloats)
+        ):
+            return cast(bytes, super().render(data, accepted_media_type, renderer_context))
+
+        try:
+            rendered = orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return cast(bytes, super().render(data, accepted_media_type, renderer_context))
+
+        # Same escaping as `JSONRenderer`, these are valid JSON but not JavaScript.
+        if b'\xe2\x80\xa8' in rendered or b'\xe2\x80\xa9' in rendered:
+            rendered = rendered.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return rendered
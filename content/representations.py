@@ -0,0 +1,155 @@
+"""
+Read-optimized representations of channels and contents.
+
+They build, from `values()` rows and a few batched queries, the same data as
+`ChannelSerializer` and `ContentSerializer` with a `None` request, without the
+field by field serialization and with the hyperlinks formatted from URL
+templates instead of a `reverse()` per link.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Iterable
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, cast
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.db.models import FileField
+from django.urls import get_script_prefix, reverse
+from django.utils.http import RFC3986_SUBDELIMS
+
+from content.models import Channel, Content, ContentFile
+from content.renderers import exact_floats
+from content.serializers import ContentSerializer
+from content.tree import channel_tree
+
+CHANNEL_FIELDS = ('pk', 'parent_id', 'title', 'language', 'picture')
+CONTENT_FIELDS = ('pk', 'channel_id', 'metadata', 'rating')
+
+# Placeholders reversed in place of the URL arguments, then replaced by them.
+PK_PLACEHOLDER = 918273645
+FILENAME_PLACEHOLDER = 'filename-placeholder'
+
+# Characters `reverse()` leaves unquoted in URLs.
+SAFE_URL_CHARACTERS = RFC3986_SUBDELIMS + '/~:@'
+
+
+@lru_cache(maxsize=32)
+def _url_template(view_name: str, script_prefix: str) -> str:
+    kwargs: dict[str, Any] = {'pk': PK_PLACEHOLDER}
+    if view_name == 'content-files':
+        kwargs['filename'] = FILENAME_PLACEHOLDER
+    return (
+        reverse(view_name, kwargs=kwargs)
+        .replace(str(PK_PLACEHOLDER), '{pk}')
+        .replace(FILENAME_PLACEHOLDER, '{filename}')
+    )
+
+
+def url_template(view_name: str) -> str:
+    """
+    Returns the URL of `view_name` with `{pk}`, and `{filename}`, placeholders.
+    """
+    return _url_template(view_name, get_script_prefix())
+
+
+def _storage_url(model: type[Channel] | type[ContentFile], field_name: str, name: str | None) -> str | None:
+    if not name:
+        return None
+    field = cast(FileField, model._meta.get_field(field_name))
+    return field.storage.url(name)
+
+
+def _ratings(rows: list[dict[str, Any]]) -> dict[int, Decimal | None]:
+    keys = {Channel.rating_cache_key(row['pk']): row for row in rows}
+    cached = cache.get_many(list(keys))
+    return {
+        row['pk']: (
+            cached[key] if key in cached
+            else Channel(pk=row['pk'], parent_id=row['parent_id']).rating()
+        )
+        for key, row in keys.items()
+    }
+
+
+def channel_representations(rows: Iterable[dict[str, Any]], identity: bool = True) -> list[dict[str, Any]]:
+    """
+    Returns the representation of the channel `rows` of `Channel.objects.values(*CHANNEL_FIELDS)`.
+    `identity` keeps the `channel` hyperlink that detail views drop.
+    """
+    rows = list(rows)
+    ids = [row['pk'] for row in rows]
+    channel_url = url_template('channel-detail')
+    content_url = url_template('content-detail')
+
+    # Sub-channels come from the channel tree, only channels it doesn't know
+    # yet are queried, and contents only of the channels that have them.
+    tree = channel_tree()
+    nodes = {pk: tree.node(pk) for pk in ids}
+    subchannels: dict[int, list[str]] = defaultdict(list)
+    for pk, node in nodes.items():
+        if node is not None and node.has_subchannels:
+            subchannels[pk] = [channel_url.format(pk=child) for child in node.subchannel_ids]
+    unknown = [pk for pk, node in nodes.items() if node is None]
+    if unknown:
+        for parent_id, pk in (
+            Channel.objects.filter(parent_id__in=unknown).order_by('pk').values_list('parent_id', 'pk')
+        ):
+            subchannels[parent_id].append(channel_url.format(pk=pk))
+    contents: dict[int, list[str]] = defaultdict(list)
+    with_contents = [pk for pk, node in nodes.items() if node is None or node.has_contents]
+    if with_contents:
+        for channel_id, pk in (
+            Content.objects.filter(channel_id__in=with_contents).order_by('pk').values_list('channel_id', 'pk')
+        ):
+            contents[channel_id].append(content_url.format(pk=pk))
+    ratings = _ratings(rows)
+
+    representations = []
+    for row in rows:
+        representation: dict[str, Any] = {}
+        if row['parent_id']:
+            representation['parent'] = channel_url.format(pk=row['parent_id'])
+        if identity:
+            representation['channel'] = channel_url.format(pk=row['pk'])
+        representation['title'] = row['title']
+        representation['language'] = row['language']
+        representation['picture'] = _storage_url(Channel, 'picture', row['picture'])
+        representation['rating'] = ratings[row['pk']]
+        if row['pk'] in subchannels:
+            representation['subchannels'] = subchannels[row['pk']]
+        if row['pk'] in contents:
+            representation['contents'] = contents[row['pk']]
+        representations.append(representation)
+
+    return representations
+
+
+def content_representation(row: dict[str, Any], identity: bool = True) -> dict[str, Any]:
+    """
+    Returns the representation of a content row of `Content.objects.values(*CONTENT_FIELDS)`.
+    `identity` keeps the `content` hyperlink that detail views drop.
+    """
+    rating_field = ContentSerializer._declared_fields['rating']
+    files_url = url_template('content-files')
+
+    representation: dict[str, Any] = {
+        'channel': url_template('channel-detail').format(pk=row['channel_id']),
+    }
+    if identity:
+        representation['content'] = url_template('content-detail').format(pk=row['pk'])
+    representation['metadata'] = row['metadata']
+    representation['rating'] = rating_field.to_representation(row['rating'])
+    representation['files'] = [
+        {
+            'file': files_url.format(
+                pk=row['pk'],
+                filename=quote(name.split('/')[-1], safe=SAFE_URL_CHARACTERS)
+            ),
+            'download': _storage_url(ContentFile, 'file', name),
+        }
+        for name in ContentFile.objects.filter(content_id=row['pk']).order_by('pk').values_list('file', flat=True)
+    ]
+    return exact_floats(representation, row['metadata'])
@@ -6,6 +6,7 @@ from django.core.files.base import ContentFile as DjangoContentFile
 from rest_framework.reverse import reverse
 from rest_framework import serializers
 from content.models import Channel, Content, ContentFile
+from content.tree import channel_tree
 
 
 class ChannelSerializer(serializers.HyperlinkedModelSerializer[Channel]):
@@ -53,13 +54,14 @@ class ChannelSerializer(serializers.HyperlinkedModelSerializer[Channel]):
         """
         representation = super().to_representation(instance)
 
-        if not instance.parent:
+        if not instance.parent_id:
             representation.pop('parent', None)
 
-        if not instance.subchannels.exists():
+        node = channel_tree().node(instance.pk)
+        if not (node.has_subchannels if node else instance.subchannels.exists()):
             representation.pop('subchannels', None)
 
-        if not instance.contents.exists():
+        if not (node.has_contents if node else instance.contents.exists()):
             representation.pop('contents', None)
 
         return representation
@@ -90,6 +92,27 @@ class ChannelSerializer(serializers.HyperlinkedModelSerializer[Channel]):
         return super().to_internal_value(data)
 
 
+class ChannelTopQuerySerializer(serializers.Serializer[None]):
+    n = serializers.IntegerField(
+        required=False,
+        default=10,
+        min_value=1,
+        max_value=100
+    )
+    language = serializers.CharField(
+        required=False,
+        max_length=5
+    )
+
+    def get_fields(self) -> dict[str, serializers.Field[Any, Any, Any, Any]]:
+        """
+        Adds the `root` field, whose name clashes with the `Field.root` property.
+        """
+        fields = super().get_fields()
+        fields['root'] = serializers.IntegerField(required=False)
+        return fields
+
+
 class ContentFileSerializer(serializers.HyperlinkedModelSerializer[ContentFile]):
     file = serializers.FileField(
         required=True,
@@ -1,18 +1,51 @@
-from typing import Any
+from typing import Any, cast
 
 from django.dispatch import receiver
 from django.db.models.signals import pre_save, post_delete, pre_delete, post_save
+from content import tree
 from content.models import Channel, ContentFile, Content
 
 
+@receiver(post_save, sender=Channel)
+def channel_post_save_bump_tree_version(sender: Any, instance: Channel, created: bool, **_kwargs: Any) -> None:
+    if created or instance.previous_parent_id != instance.parent_id:
+        tree.bump_version()
+
+
+@receiver(post_save, sender=Content)
+def content_post_save_bump_tree_version(sender: Any, instance: Content, created: bool, **_kwargs: Any) -> None:
+    # Only moves and the first content of a channel change the structure.
+    if created:
+        changed = not Content.objects.filter(channel_id=instance.channel_id).exclude(pk=instance.pk).exists()
+    else:
+        changed = instance.loaded_channel_id != instance.channel_id
+    if changed:
+        tree.bump_version()
+
+
+@receiver(post_delete, sender=Channel)
+def channel_post_delete_bump_tree_version(sender: Any, instance: Channel, **_kwargs: Any) -> None:
+    tree.bump_version()
+
+
+@receiver(post_delete, sender=Content)
+def content_post_delete_bump_tree_version(sender: Any, instance: Content, **_kwargs: Any) -> None:
+    # Only the last content of a channel changes the structure.
+    if not Content.objects.filter(channel_id=instance.channel_id).exists():
+        tree.bump_version()
+
+
 @receiver(pre_save, sender=Channel)
 def channel_pre_save(sender: Any, instance: Channel, **_kwargs: dict[str, Any]) -> None:
+    instance.previous_parent_id = None
     if instance.pk:
         try:
             old_instance = Channel.objects.get(pk=instance.pk)
         except Channel.DoesNotExist:
             return
 
+        instance.previous_parent_id = old_instance.parent_id
+
         old_picture = old_instance.picture
         if old_picture and old_picture != instance.picture:
             old_picture.delete(save=False)
@@ -25,7 +58,7 @@ def channel_post_delete(sender: Any, instance: Channel, **_kwargs: dict[str, Any
 
 
 @receiver(pre_save, sender=ContentFile)
-def content_file_pre_save(_sender: Any, instance: ContentFile, **_kwargs: dict[str, Any]) -> None:
+def content_file_pre_save(sender: Any, instance: ContentFile, **_kwargs: dict[str, Any]) -> None:
     if instance.pk:
         try:
             old_instance = ContentFile.objects.get(pk=instance.pk)
@@ -53,3 +86,43 @@ def channel_invalidate_cache(sender: Any, instance: Channel, **_kwargs: dict[str
 @receiver(pre_delete, sender=Content)
 def content_invalidate_cache(sender: Any, instance: Content, **_kwargs: dict[str, Any]) -> None:
     instance.channel.invalidate_cache()
+
+
+@receiver(post_save, sender=Channel)
+def channel_refresh_indexed_rating(sender: Any, instance: Channel, **_kwargs: dict[str, Any]) -> None:
+    Channel.refresh_indexed_rating(instance.pk)
+
+
+@receiver(post_delete, sender=Channel)
+def channel_post_delete_refresh_indexed_rating(sender: Any, instance: Channel, **_kwargs: dict[str, Any]) -> None:
+    Channel.refresh_indexed_rating(instance.parent_id)
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def content_refresh_indexed_rating(sender: Any, instance: Content, **_kwargs: dict[str, Any]) -> None:
+    Channel.refresh_indexed_rating(instance.channel_id)
+
+
+def _refresh_previous_parent(pk: int) -> None:
+    """
+    Invalidates and refreshes the ratings of a channel, and its ancestors, that a child left.
+    """
+    channel = Channel.objects.filter(pk=pk).first()
+    if channel is not None:
+        channel.invalidate_cache()
+        Channel.refresh_indexed_rating(pk)
+
+
+@receiver(post_save, sender=Channel)
+def channel_moved_refresh_previous_parent(sender: Any, instance: Channel, created: bool, **_kwargs: Any) -> None:
+    if not created and instance.previous_parent_id not in (None, instance.parent_id):
+        _refresh_previous_parent(cast(int, instance.previous_parent_id))
+
+
+@receiver(post_save, sender=Content)
+def content_moved_refresh_previous_channel(sender: Any, instance: Content, created: bool, **_kwargs: Any) -> None:
+    if not created and isinstance(instance.loaded_channel_id, int) and instance.loaded_channel_id != instance.channel_id:
+        _refresh_previous_parent(instance.loaded_channel_id)
+    # Registered last, the receivers above compare it with the channel before the save.
+    instance.loaded_channel_id = instance.channel_id
@@ -0,0 +1,144 @@
+"""
+Single-flight recomputation of cached values.
+
+When a popular key is invalidated, every concurrent reader misses at once.
+Only the caller that takes the key's lock recomputes it; the others get the
+previous value, marked as stale, or wait briefly for the new one. The lock is
+a cache key added atomically, so it works across threads and, with a shared
+cache backend, across processes, and it expires so a crashed computation
+can't wedge the key.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from typing import Generic, NamedTuple, TypeVar, cast
+
+from django.core.cache import cache
+
+T = TypeVar('T')
+
+MISSING = object()
+POLL_INTERVAL = 0.01
+
+GENERATION_CACHE_KEY = 'singleflight_generation'
+
+
+class Lookup(NamedTuple, Generic[T]):
+    value: T
+    stale: bool
+
+
+class SingleFlightStats:
+    """
+    Counters of how cache misses were served in this process.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.waited = 0
+        self.stale = 0
+        self.timed_out = 0
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @property
+    def avoided(self) -> int:
+        """
+        Duplicate computations avoided serving the new value or a stale one.
+        """
+        return self.waited + self.stale
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'computed': self.computed,
+                'waited': self.waited,
+                'stale': self.stale,
+                'timed_out': self.timed_out,
+                'avoided': self.avoided,
+            }
+
+
+stats = SingleFlightStats()
+
+
+def lock_key(key: str) -> str:
+    return f"{key}_lock"
+
+
+def stale_key(key: str) -> str:
+    return f"{key}_stale"
+
+
+def generation() -> str:
+    """
+    Returns a token that changes with every invalidation, so values computed outside
+    `get_or_compute` can be checked for invalidations since they were computed.
+    An evicted token is replaced too, which only reports an invalidation that wasn't.
+    """
+    token = cache.get(GENERATION_CACHE_KEY)
+    if token is None:
+        cache.add(GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        token = cache.get(GENERATION_CACHE_KEY, '')
+    return cast(str, token)
+
+
+def invalidate(keys: list[str], stale_timeout: float) -> None:
+    """
+    Removes `keys`, keeping their values as stale for `stale_timeout` seconds,
+    and releases their locks so values computed before it aren't cached.
+    """
+    values = cache.get_many(keys)
+    if values:
+        cache.set_many({stale_key(key): value for key, value in values.items()}, timeout=stale_timeout)
+    cache.delete_many([*keys, *map(lock_key, keys)])
+    cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_or_compute(key: str, compute: Callable[[], Lookup[T]], lock_timeout: float, wait: float) -> Lookup[T]:
+    """
+    Returns the cached value of `key`, computing and caching it if it's missing
+    and no other caller is already computing it.
+
+    `compute` tells whether its value is stale, e.g. computed from other stale
+    values, stale values are returned but never cached.
+    """
+    value = cache.get(key, MISSING)
+    if value is not MISSING:
+        return Lookup(cast(T, value), False)
+
+    token = uuid.uuid4().hex
+    if cache.add(lock_key(key), token, timeout=lock_timeout):
+        try:
+            computed = compute()
+            # Not cached if invalidated while computing, it could be outdated.
+            if not computed.stale and cache.get(lock_key(key)) == token:
+                cache.set(key, computed.value, timeout=None)
+        finally:
+            if cache.get(lock_key(key)) == token:
+                cache.delete(lock_key(key))
+        stats.count('computed')
+        return computed
+
+    value = cache.get(stale_key(key), MISSING)
+    if value is not MISSING:
+        stats.count('stale')
+        return Lookup(cast(T, value), True)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key, MISSING)
+        if value is not MISSING:
+            stats.count('waited')
+            return Lookup(cast(T, value), False)
+
+    # Computed while another caller may be caching an older or newer value.
+    stats.count('timed_out')
+    return Lookup(compute().value, True)
@@ -1,5 +1,41 @@
-from django.test import TestCase
-from content.models import Channel, Content
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections.abc import Callable
+from datetime import timedelta
+from decimal import Decimal
+from random import Random
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile as DjangoContentFile
+from django.core.management import call_command
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from content import singleflight
+from content.bundles import BundleError, build_bundle, build_delta, apply_delta, verify_bundle
+from content.db import is_pinned_to_primary, use_primary
+from content.deletion import get_job, start_subtree_deletion
+from content.loadtest import generate_requests, run_load_test, wsgi_transport
+from content.middleware import PRIMARY_PIN_COOKIE, AdaptiveLimiter
+from content.models import Channel, ChannelDeletionJob, Content, ContentFile
+from content.ratings import batch_ratings
+from content.renderers import FastJSONRenderer
+from content.representations import CHANNEL_FIELDS, CONTENT_FIELDS, channel_representations, content_representation
+from content.serializers import ChannelSerializer, ContentSerializer
+from content.tree import VERSION_CACHE_KEY, ChannelTree, channel_tree
+from content.warmup import record_channel_read, warm_rating_cache, warmup_order
 
 class TestChannel(TestCase):
     def test_channel_rating(self) -> None:
@@ -23,3 +59,671 @@ class TestChannel(TestCase):
         subchannel_1 = Channel.objects.get(pk=subchannel_1.pk)
         subchannel_1.delete()
         self.assertEqual(channel.rating(), 6.50)
+
+
+class TestCatalogBundle(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        settings_override = override_settings(MEDIA_ROOT=os.path.join(self.tmp.name, 'media'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmp.name, name)
+
+    def test_bundle_delta_round_trip(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        subchannel = Channel.objects.create(parent=channel, title='Subchannel', language='en')
+        content = Content.objects.create(channel=subchannel, metadata={'title': 'Movie'}, rating=5.00)
+        movie = ContentFile(content=content)
+        movie.file.save('movie.bin', DjangoContentFile(b'0123456789abcdef'))
+        notes = ContentFile(content=content)
+        notes.file.save('notes.txt', DjangoContentFile(b'notes'))
+
+        base = build_bundle(channel, self.path('v1.zip'), version='1', chunk_size=4)
+        self.assertEqual([entry['id'] for entry in base['channels']], [channel.pk, subchannel.pk])
+        self.assertEqual(Decimal(base['channels'][0]['rating']), Decimal('5.00'))
+        self.assertEqual(len(base['files'][movie.file.name]['chunks']), 4)
+
+        with movie.file.open('wb') as stream:
+            stream.write(b'0123XXXX89abcdefGH')
+        target = build_bundle(channel, self.path('v2.zip'), version='2', chunk_size=4)
+
+        delta = build_delta(self.path('v1.zip'), self.path('v2.zip'), self.path('delta.zip'))
+        self.assertEqual(list(delta['files']), [movie.file.name])
+        self.assertEqual(
+            [source for source, _reference in delta['files'][movie.file.name]['ops']],
+            ['base', 'delta', 'base', 'base', 'delta']
+        )
+
+        rebuilt = apply_delta(self.path('v1.zip'), self.path('delta.zip'), self.path('v2-rebuilt.zip'))
+        self.assertEqual(rebuilt, target)
+        verify_bundle(self.path('v2-rebuilt.zip'))
+        with zipfile.ZipFile(self.path('v2-rebuilt.zip')) as archive:
+            self.assertEqual(archive.read('media/' + movie.file.name), b'0123XXXX89abcdefGH')
+            self.assertEqual(archive.read('media/' + notes.file.name), b'notes')
+
+        with self.assertRaises(BundleError):
+            apply_delta(self.path('v2.zip'), self.path('delta.zip'), self.path('wrong.zip'))
+
+    def test_failed_bundles_leave_no_files(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        content = Content.objects.create(channel=channel, metadata={}, rating=5.00)
+        for index in range(6):
+            ContentFile(content=content).file.save(f'file{index}.bin', DjangoContentFile(b'data' * (index + 1)))
+        tampered = ContentFile.objects.order_by('pk')[2].file
+        build_bundle(channel, self.path('v1.zip'), chunk_size=4)
+        build_delta(self.path('v1.zip'), self.path('v1.zip'), self.path('delta.zip'))
+        # Same manifest, so the delta applies, but a media file that doesn't match it.
+        with zipfile.ZipFile(self.path('v1.zip')) as source, zipfile.ZipFile(self.path('base.zip'), 'w') as base:
+            for item in source.infolist():
+                base.writestr(item, b'XXXX' if item.filename == 'media/' + tampered.name else source.read(item))
+
+        spool = self.path('spool')
+        os.mkdir(spool)
+        with mock.patch('tempfile.tempdir', spool):
+            with self.assertRaises(BundleError):
+                apply_delta(self.path('base.zip'), self.path('delta.zip'), self.path('rebuilt.zip'), workers=1)
+            os.unlink(tampered.path)
+            with self.assertRaises(FileNotFoundError):
+                build_bundle(channel, self.path('v2.zip'), chunk_size=4, workers=1)
+        self.assertEqual(os.listdir(spool), [])
+        self.assertFalse(os.path.exists(self.path('rebuilt.zip')))
+        self.assertFalse(os.path.exists(self.path('v2.zip')))
+
+    def test_catalog_bundle_command(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        call_command('catalog_bundle', 'build', str(channel.pk), self.path('bundle.zip'), stdout=open(os.devnull, 'w'))
+        call_command('catalog_bundle', 'verify', self.path('bundle.zip'), stdout=open(os.devnull, 'w'))
+
+
+class TestChannelTop(TestCase):
+    def setUp(self) -> None:
+        self.root = Channel.objects.create(title='Root', language='en')
+        self.low = Channel.objects.create(parent=self.root, title='Low', language='en')
+        self.high = Channel.objects.create(parent=self.root, title='High', language='es')
+        self.other = Channel.objects.create(title='Other', language='en')
+        self.empty = Channel.objects.create(title='Empty', language='en')
+        Content.objects.create(channel=self.low, metadata={}, rating=2.00)
+        Content.objects.create(channel=self.high, metadata={}, rating=9.00)
+        Content.objects.create(channel=self.other, metadata={}, rating=6.00)
+
+    def test_indexed_rating_follows_changes(self) -> None:
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.indexed_rating, Decimal('5.50'))
+
+        self.high.delete()
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.indexed_rating, Decimal('2.00'))
+
+    def test_moves_refresh_previous_parents(self) -> None:
+        self.assertEqual(self.root.rating(), Decimal('5.50'))
+        high = Channel.objects.get(pk=self.high.pk)
+        high.parent = self.empty
+        high.save()
+
+        self.root.refresh_from_db()
+        self.empty.refresh_from_db()
+        self.assertEqual((self.root.indexed_rating, self.root.rating()), (Decimal('2.00'), Decimal('2.00')))
+        self.assertEqual(self.empty.indexed_rating, Decimal('9.00'))
+
+        content = Content.objects.get(channel=self.low)
+        content.channel = self.other
+        content.save()
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.indexed_rating, self.root.rating()), (None, None))
+
+    def test_top_channels(self) -> None:
+        response = self.client.get('/channels/top/', {'n': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([channel['title'] for channel in response.json()], ['High', 'Other', 'Root'])
+
+        response = self.client.get('/channels/top/', {'language': 'en'})
+        self.assertEqual([channel['title'] for channel in response.json()], ['Other', 'Root', 'Low'])
+
+        response = self.client.get('/channels/top/', {'root': self.root.pk})
+        self.assertEqual([channel['title'] for channel in response.json()], ['High', 'Low'])
+
+        self.assertEqual(self.client.get('/channels/top/', {'n': 0}).status_code, 400)
+
+    def test_export_channels_in_rating_order(self) -> None:
+        mid = Channel.objects.create(parent=self.root, title='Mid', language='en')
+        Content.objects.create(channel=mid, metadata={}, rating=6.00)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'ratings.csv')
+            call_command('export_channels', output, stdout=open(os.devnull, 'w'))
+            with open(output) as csvfile:
+                rows = list(csv.reader(csvfile))
+        # Sorted by the rounded `indexed_rating` but with the exact rating, as `rating()`.
+        self.assertEqual(rows, [['Channel Title', 'Rating'], *(
+            [title, str(Channel.objects.get(title=title).rating() or '')]
+            for title in ['High', 'Other', 'Mid', 'Root', 'Low', 'Empty']
+        )])
+        self.assertEqual(rows[4][1], '5.666666666666666666666666667')
+
+
+class TestReplicaRouting(SimpleTestCase):
+    """
+    Routes between the test database and three SQLite files registered
+    as replicas, one of them in a directory that doesn't exist and another
+    without tables.
+    """
+    tmp: tempfile.TemporaryDirectory[str]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tmp = tempfile.TemporaryDirectory()
+        for alias, name in [
+            ('replica-file', os.path.join(cls.tmp.name, 'replica.sqlite3')),
+            ('replica-down', os.path.join(cls.tmp.name, 'missing', 'replica.sqlite3')),
+            ('replica-empty', os.path.join(cls.tmp.name, 'empty.sqlite3')),
+        ]:
+            connections.settings[alias] = {**connections.settings['default'], 'NAME': name}
+        # Declared here because the aliases don't exist before the class is set up.
+        cls.databases = {'default', 'replica-file', 'replica-down', 'replica-empty'}
+        super().setUpClass()
+
+        with connections['replica-file'].schema_editor() as editor:
+            editor.create_model(Channel)
+            editor.create_model(Content)
+            editor.create_model(ChannelDeletionJob)
+        with connections['replica-file'].cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO content_channel (title, language, created_at, updated_at)"
+                " VALUES ('Replica', 'en', '2024-01-01', '2024-01-01')"
+            )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        for alias in ['replica-file', 'replica-down', 'replica-empty']:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.tmp.cleanup()
+
+    @override_settings(DATABASE_REPLICAS=['replica-file'])
+    def test_reads_go_to_replica_until_writes(self) -> None:
+        with use_primary(False):
+            self.assertEqual(list(Channel.objects.values_list('title', flat=True)), ['Replica'])
+
+            channel = Channel.objects.create(title='Primary', language='en')
+            self.assertTrue(is_pinned_to_primary())
+            self.assertEqual(list(Channel.objects.values_list('title', flat=True)), ['Primary'])
+            channel.delete()
+
+    @override_settings(DATABASE_REPLICAS=['replica-file'])
+    def test_deletion_jobs_are_on_primary(self) -> None:
+        channel = Channel.objects.create(title='Primary', language='en')
+        with use_primary(False):
+            job = start_subtree_deletion(channel.pk)
+            deadline = time.monotonic() + 5
+            while (polled := get_job(job.pk)) is not None and polled.status != 'done' and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual((polled and polled.status, polled and polled.channels), ('done', 1))
+        ChannelDeletionJob.objects.all().delete()
+
+    @override_settings(DATABASE_REPLICAS=['replica-file'])
+    def test_tree_is_loaded_from_primary(self) -> None:
+        channel = Channel.objects.create(title='Primary', language='en')
+        try:
+            with use_primary(False):
+                self.assertEqual(list(ChannelTree.load('version').ids), [channel.pk])
+        finally:
+            channel.delete()
+
+    @override_settings(DATABASE_REPLICAS=['replica-file'])
+    def test_batch_ratings_are_computed_on_primary(self) -> None:
+        channel = Channel.objects.create(title='Primary', language='en')
+        Content.objects.create(channel=channel, metadata={}, rating=5.00)
+        try:
+            with use_primary(False):
+                self.assertEqual(batch_ratings(), {channel.pk: Decimal('5.00')})
+        finally:
+            channel.delete()
+
+    @override_settings(DATABASE_REPLICAS=['replica-down'])
+    def test_unavailable_replica_falls_back_to_primary(self) -> None:
+        with use_primary(False):
+            self.assertEqual(Channel.objects.all().db, 'default')
+            self.assertFalse(Channel.objects.exists())
+
+    @override_settings(DATABASE_REPLICAS=['replica-empty'])
+    def test_replica_without_schema_falls_back_to_primary(self) -> None:
+        with use_primary(False):
+            self.assertEqual(Channel.objects.all().db, 'default')
+            self.assertFalse(Channel.objects.exists())
+
+    @override_settings(DATABASE_REPLICAS=['replica-file'])
+    def test_ratings_are_computed_on_primary(self) -> None:
+        channel = Channel.objects.create(title='Primary', language='en')
+        Content.objects.create(channel=channel, metadata={}, rating=5.00)
+        try:
+            with use_primary(False):
+                cache.delete(channel._rating_cache_key())
+                # The replica has no contents for the channel yet.
+                self.assertEqual(Channel(pk=channel.pk).rating(), Decimal('5.00'))
+        finally:
+            channel.delete()
+
+
+class TestPrimaryPinning(TestCase):
+    def test_client_is_pinned_after_writes(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        self.assertNotIn(PRIMARY_PIN_COOKIE, self.client.get(f'/channels/{channel.pk}/').cookies)
+
+        response = self.client.patch(f'/channels/{channel.pk}/', {'title': 'Renamed'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]['max-age'], 10)
+
+
+class TestSQLiteProfile(TestCase):
+    def test_pragmas_applied_to_new_connections(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone(), (1,))
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone(), (5000,))
+
+    def test_benchmark_sqlite(self) -> None:
+        output = io.StringIO()
+        call_command('benchmark_sqlite', seconds=0.1, readers=2, writers=1, channels=10, stdout=output)
+        self.assertIn('Throughput speedup', output.getvalue())
+
+
+class TestBatchRatings(TestCase):
+    def test_batch_ratings_match_rating(self) -> None:
+        random = Random(42)
+        channels = [Channel.objects.create(title='Root', language='en')]
+        for index in range(60):
+            parent = random.choice(channels)
+            if not parent.contents.exists():
+                channels.append(Channel.objects.create(parent=parent, title=f'Channel {index}', language='en'))
+        for channel in channels:
+            if not channel.subchannels.exists() and random.random() < 0.8:
+                for _ in range(random.randint(1, 3)):
+                    Content.objects.create(channel=channel, metadata={}, rating=random.choice([0, 3.33, 5, 7.25, 10]))
+
+        ratings = batch_ratings()
+        cache.clear()
+        self.assertEqual(ratings, {channel.pk: channel.rating() for channel in channels})
+
+    def test_recompute_ratings_fixes_indexed_ratings(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        Content.objects.create(channel=channel, metadata={}, rating=4.00)
+        Channel.objects.filter(pk=channel.pk).update(indexed_rating=None)
+
+        call_command('recompute_ratings', fix=True, stdout=io.StringIO())
+        channel.refresh_from_db()
+        self.assertEqual(channel.indexed_rating, Decimal('4.00'))
+
+
+class TestRatingWarmup(TestCase):
+    def test_warm_ratings_fills_cache(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        subchannel = Channel.objects.create(parent=channel, title='Subchannel', language='en')
+        empty = Channel.objects.create(parent=channel, title='Empty', language='en')
+        Content.objects.create(channel=subchannel, metadata={}, rating=8.00)
+        cache.clear()
+
+        call_command('warm_ratings', rate=0, stdout=io.StringIO())
+        self.assertEqual(cache.get(Channel.rating_cache_key(channel.pk)), Decimal('8.00'))
+        self.assertEqual(cache.get(Channel.rating_cache_key(subchannel.pk)), Decimal('8.00'))
+        self.assertIn(Channel.rating_cache_key(empty.pk), cache)
+        self.assertIsNone(cache.get(Channel.rating_cache_key(empty.pk)))
+
+    def test_warm_ratings_keeps_priority_channels_cached(self) -> None:
+        roots = [Channel.objects.create(title=f'Root {index}', language='en') for index in range(2)]
+        children = [Channel.objects.create(parent=roots[0], title=f'Child {index}', language='en') for index in range(8)]
+        caches = {'default': {**settings.CACHES['default'], 'OPTIONS': {'MAX_ENTRIES': 6, 'CULL_FREQUENCY': 2}}}
+        with override_settings(CACHES=caches, RATING_WARMUP_MAX_CHANNELS=10):
+            for _ in range(2):
+                record_channel_read(children[5].pk)
+            result = warm_rating_cache(rate=0, batch_size=3)
+            self.assertEqual(result.channels, 10)
+            self.assertEqual(result.cached, len(cache.get_many([
+                Channel.rating_cache_key(channel.pk) for channel in [*roots, *children]
+            ])))
+            for channel in [*roots, children[5]]:
+                self.assertIn(Channel.rating_cache_key(channel.pk), cache)
+
+        with override_settings(RATING_WARMUP_MAX_CHANNELS=3):
+            cache.clear()
+            self.assertEqual(warm_rating_cache(rate=0).warmed, 3)
+
+    def test_warm_ratings_skips_ratings_invalidated_meanwhile(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        content = Content.objects.create(channel=channel, metadata={}, rating=4.00)
+        cache.clear()
+        calls: list[dict[int, Decimal | None]] = []
+
+        def ratings_then_update() -> dict[int, Decimal | None]:
+            calls.append(batch_ratings())
+            if len(calls) == 1:
+                content.rating = Decimal('6.00')
+                content.save()
+            return calls[-1]
+
+        with mock.patch('content.warmup.batch_ratings', side_effect=ratings_then_update):
+            warm_rating_cache(rate=0)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.get(Channel.rating_cache_key(channel.pk)), Decimal('6.00'))
+
+    def test_warmup_order(self) -> None:
+        cache.clear()
+        for _ in range(3):
+            record_channel_read(5)
+        record_channel_read(4)
+
+        ratings: dict[int, Decimal | None] = {pk: None for pk in range(1, 7)}
+        self.assertEqual(warmup_order(ratings, roots={6}, batch_size=2), [6, 5, 4, 1, 2, 3])
+
+
+class TestSingleFlight(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self) -> None:
+        calls = []
+
+        def compute() -> singleflight.Lookup[int]:
+            calls.append(1)
+            time.sleep(0.2)
+            return singleflight.Lookup(42, False)
+
+        before = singleflight.stats.snapshot()
+        results: list[singleflight.Lookup[int]] = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                singleflight.get_or_compute('popular', compute, lock_timeout=5, wait=2)
+            ))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [singleflight.Lookup(42, False)] * 5)
+        self.assertEqual(singleflight.stats.snapshot()['avoided'] - before['avoided'], 4)
+
+    def test_stale_value_while_recomputing(self) -> None:
+        cache.set('popular', 1)
+        singleflight.invalidate(['popular'], stale_timeout=60)
+        cache.add(singleflight.lock_key('popular'), 'other', timeout=5)
+
+        lookup = singleflight.get_or_compute('popular', lambda: singleflight.Lookup(2, False), lock_timeout=5, wait=0)
+        self.assertEqual(lookup, singleflight.Lookup(1, True))
+
+    def test_expired_lock_does_not_wedge_key(self) -> None:
+        cache.add(singleflight.lock_key('popular'), 'crashed', timeout=0.05)
+        time.sleep(0.1)
+
+        lookup = singleflight.get_or_compute('popular', lambda: singleflight.Lookup(2, False), lock_timeout=5, wait=0)
+        self.assertEqual(lookup, singleflight.Lookup(2, False))
+        self.assertEqual(cache.get('popular'), 2)
+
+
+class TestStaleRatings(TestCase):
+    def test_parent_of_stale_rating_is_stale_and_not_cached(self) -> None:
+        root = Channel.objects.create(title='Root', language='en')
+        leaf = Channel.objects.create(parent=root, title='Leaf', language='en')
+        content = Content.objects.create(channel=leaf, metadata={}, rating=2.00)
+        self.assertEqual(root.rating(), 2)
+
+        Content.objects.filter(pk=content.pk).update(rating=8.00)
+        leaf.invalidate_cache()
+        cache.add(singleflight.lock_key(leaf._rating_cache_key()), 'other', timeout=5)
+        self.assertEqual(root.rating_state(), singleflight.Lookup(2, True))
+        self.assertNotIn(root._rating_cache_key(), cache)
+
+        cache.delete(singleflight.lock_key(leaf._rating_cache_key()))
+        self.assertEqual(root.rating_state(), singleflight.Lookup(8, False))
+
+
+class TestReadPath(TestCase):
+    def setUp(self) -> None:
+        self.root = Channel.objects.create(title='Raíz   "root"', language='es')
+        Channel.objects.filter(pk=self.root.pk).update(picture=f'channels/{self.root.pk}/my picture ñ.png')
+        self.subchannel = Channel.objects.create(parent=self.root, title='Sub', language='en')
+        self.other = Channel.objects.create(parent=self.root, title='Other', language='en')
+        Channel.objects.create(title='Empty', language='en')
+        self.content = Content.objects.create(
+            channel=self.subchannel, metadata={'title': 'Película\u2028', 'tags': ['a', 1, None]}, rating=3.33
+        )
+        Content.objects.create(channel=self.subchannel, metadata={}, rating=7.25)
+        Content.objects.create(channel=self.other, metadata={}, rating=0)
+        Content.objects.create(
+            channel=self.other,
+            metadata={'duration': 1e-07, 'big': 1e22, 'small': 1e-05, 'plain': 0.5, 'values': [1.5e16, -2e-9]},
+            rating=5
+        )
+        for name in ['my file (1).mp4', 'ñ&?#.txt']:
+            ContentFile.objects.create(content=self.content, file=f'contents/{self.content.pk}/{name}')
+
+    def test_channels_are_byte_identical(self) -> None:
+        channels = Channel.objects.order_by('pk')
+        expected = JSONRenderer().render(ChannelSerializer(channels, many=True, context={'request': None}).data)
+        self.assertEqual(FastJSONRenderer().render(channel_representations(channels.values(*CHANNEL_FIELDS))), expected)
+
+        for channel in channels:
+            data = ChannelSerializer(channel, context={'request': None}).data
+            data.pop('channel', None)
+            self.assertEqual(self.client.get(f'/channels/{channel.pk}/').content, JSONRenderer().render(data))
+
+    def test_contents_are_byte_identical(self) -> None:
+        for content in Content.objects.all():
+            expected = JSONRenderer().render(ContentSerializer(content, context={'request': None}).data)
+            fast = content_representation(Content.objects.values(*CONTENT_FIELDS).get(pk=content.pk))
+            self.assertEqual(FastJSONRenderer().render(fast), expected)
+
+            data = ContentSerializer(content, context={'request': None}).data
+            data.pop('content', None)
+            self.assertEqual(self.client.get(f'/contents/{content.pk}/').content, JSONRenderer().render(data))
+
+    def test_content_writes_keep_floats(self) -> None:
+        metadata = {'duration': 1e-07, 'big': 1e22}
+        response = self.client.patch(
+            f'/contents/{self.content.pk}/', {'metadata': metadata}, content_type='application/json'
+        )
+        self.assertIn(b'"duration":1e-07,"big":1e+22', response.content)
+
+    def test_channel_list(self) -> None:
+        response = self.client.get('/')
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(
+            response.json()['results'],
+            json.loads(JSONRenderer().render(
+                ChannelSerializer(Channel.objects.filter(parent=None), many=True, context={'request': None}).data
+            ))
+        )
+
+
+class TestChannelTree(TestCase):
+    def test_tree_answers_structure_without_queries(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        subchannel = Channel.objects.create(parent=channel, title='Subchannel', language='en')
+        leaf = Channel.objects.create(parent=subchannel, title='Leaf', language='en')
+        Content.objects.create(channel=leaf, metadata={}, rating=5.00)
+
+        tree = channel_tree()
+        with self.assertNumQueries(0):
+            node = tree.node(leaf.pk)
+            assert node is not None
+            self.assertEqual(node.ancestor_ids, [subchannel.pk, channel.pk])
+            self.assertTrue(node.has_contents)
+            self.assertFalse(node.has_subchannels)
+            self.assertTrue(tree.has_subchannels(channel.pk))
+            self.assertEqual(tree.node(channel.pk).subchannel_ids, [subchannel.pk])  # type: ignore[union-attr]
+        # Loaded within the test transaction, so it isn't kept.
+        self.assertIsNot(channel_tree(), tree)
+
+    def test_tree_expires(self) -> None:
+        tree = ChannelTree('version', [(1, None, False)])
+        self.assertTrue(tree.is_current('version'))
+        self.assertFalse(tree.is_current('other'))
+        with override_settings(CHANNEL_TREE_MAX_AGE=0):
+            self.assertFalse(tree.is_current('version'))
+
+    def test_only_structural_changes_bump_version(self) -> None:
+        def bumped(change: Callable[[], object]) -> bool:
+            version = cache.get(VERSION_CACHE_KEY)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            return bool(cache.get(VERSION_CACHE_KEY) != version)
+
+        channel = Channel.objects.create(title='Channel', language='en')
+        other = Channel.objects.create(title='Other', language='en')
+        self.assertFalse(bumped(Channel.objects.get(pk=other.pk).save))
+
+        self.assertTrue(bumped(lambda: Content.objects.create(channel=channel, metadata={}, rating=5.00)))
+        content = Content.objects.create(channel=channel, metadata={}, rating=5.00)
+        self.assertFalse(bumped(lambda: Content.objects.create(channel=channel, metadata={}, rating=5.00)))
+
+        content = Content.objects.get(pk=content.pk)
+        content.channel = other
+        self.assertTrue(bumped(content.save))
+        self.assertFalse(bumped(Content.objects.filter(channel=channel)[0].delete))
+        self.assertTrue(bumped(content.delete))
+        self.assertTrue(bumped(other.delete))
+
+    def test_clean_checks_the_database(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        channel_tree()
+        # Without signals, so the tree doesn't know about the contents.
+        Content.objects.bulk_create([Content(channel=channel, metadata={}, rating=5.00)])
+        with self.assertRaises(ValidationError):
+            Channel.objects.create(parent=channel, title='Subchannel', language='en')
+
+
+class TestChannelDeletion(TestCase):
+    @override_settings(CHANNEL_DELETION_EAGER=True, CHANNEL_DELETION_BATCH_SIZE=2)
+    def test_delete_subtree(self) -> None:
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            root = Channel.objects.create(title='Root', language='en')
+            kept = Channel.objects.create(parent=root, title='Kept', language='en')
+            Content.objects.create(channel=kept, metadata={}, rating=4.00)
+            deleted = Channel.objects.create(parent=root, title='Deleted', language='en')
+            leaves = [
+                Channel.objects.create(parent=deleted, title=f'Leaf {index}', language='en') for index in range(3)
+            ]
+            for leaf in leaves:
+                content = Content.objects.create(channel=leaf, metadata={}, rating=8.00)
+                ContentFile.objects.create(content=content, file=DjangoContentFile(b'data', name='file.txt'))
+            paths = [file.file.path for file in ContentFile.objects.all()]
+            self.assertEqual(root.rating(), Decimal('6.00'))
+
+            response = self.client.delete(f'/channels/{deleted.pk}/')
+            self.assertEqual(response.status_code, 202)
+            # Jobs are kept in the database, not in the cache of the worker.
+            cache.clear()
+            job = self.client.get(response.headers['Location']).json()
+
+        self.assertEqual(
+            (job['status'], job['channels'], job['contents'], job['files']),
+            ('done', 4, 3, 3)
+        )
+        self.assertFalse(Channel.objects.filter(pk__in=[deleted.pk, *(leaf.pk for leaf in leaves)]).exists())
+        self.assertFalse(any(map(os.path.exists, paths)))
+        self.assertEqual(Channel.objects.get(pk=root.pk).rating(), Decimal('4.00'))
+        self.assertEqual(Channel.objects.get(pk=root.pk).indexed_rating, Decimal('4.00'))
+        self.assertNotIn(deleted.pk, channel_tree())
+
+    @override_settings(CHANNEL_DELETION_EAGER=True)
+    def test_failed_and_interrupted_jobs(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        with mock.patch('content.deletion._levels', side_effect=RuntimeError):
+            job = self.client.get(self.client.delete(f'/channels/{channel.pk}/').headers['Location']).json()
+        self.assertEqual((job['status'], job['error']), ('failed', 'RuntimeError'))
+
+        running = ChannelDeletionJob.objects.create(channel_id=channel.pk, status=ChannelDeletionJob.Status.RUNNING)
+        url = f'/channels/deletions/{running.pk}/'
+        self.assertEqual(self.client.get(url).json()['status'], 'running')
+        ChannelDeletionJob.objects.filter(pk=running.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=settings.CHANNEL_DELETION_STALE_AFTER + 1)
+        )
+        self.assertEqual(self.client.get(url).json()['status'], 'failed')
+        self.assertEqual(self.client.get('/channels/deletions/not-a-job/').status_code, 404)
+
+
+class TestAdmissionControl(SimpleTestCase):
+    def test_limiter_queues_rejects_and_adapts(self) -> None:
+        limiter = AdaptiveLimiter(
+            limit=1, min_limit=1, max_limit=2, queue=1, queue_timeout=5, target_latency=0.1, retry_after=1
+        )
+        self.assertTrue(limiter.acquire())
+
+        def wait() -> None:
+            if limiter.acquire():
+                limiter.release(0)
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        while limiter.snapshot()['queue_depth'] < 1:
+            time.sleep(0.001)
+        self.assertFalse(limiter.acquire())
+
+        limiter.release(0)
+        waiter.join()
+        self.assertEqual(limiter.snapshot()['rejected'], 1)
+        self.assertEqual(limiter.snapshot()['admitted'], 2)
+        self.assertEqual(limiter.limit, 2)
+
+        limiter.acquire()
+        limiter.release(1)
+        self.assertEqual(limiter.limit, 1.8)
+        # The decrease from 2 takes admitted concurrency down to one.
+        limiter.queue_timeout = 0
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        self.assertEqual(limiter.snapshot()['capacity'], 1)
+
+    def test_overloaded_requests_are_shed(self) -> None:
+        admission = {
+            name: {
+                'limit': 0 if name == 'cheap_reads' else 8, 'min_limit': 0, 'max_limit': 8,
+                'queue': 0, 'queue_timeout': 0, 'target_latency': 1, 'retry_after': 3,
+            }
+            for name in settings.ADMISSION_CONTROL
+        }
+        with override_settings(ADMISSION_CONTROL=admission):
+            response = self.client.get('/contents/1/')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '3')
+
+            metrics = self.client.get('/metrics/admission/').json()
+        self.assertEqual(metrics['admission']['cheap_reads']['rejected'], 1)
+        self.assertIn('avoided', metrics['singleflight'])
+
+
+class TestLoadTest(TestCase):
+    def test_generated_mix_replays_in_process(self) -> None:
+        channel = Channel.objects.create(title='Channel', language='en')
+        for index in range(3):
+            leaf = Channel.objects.create(parent=channel, title=f'Leaf {index}', language='en')
+            for _ in range(4):
+                Content.objects.create(channel=leaf, metadata={}, rating=5.00)
+        specs = generate_requests(30, seed=1, upload_size=16)
+        self.assertEqual(len(specs), 30)
+        deleted = [spec.path for spec in specs if spec.method == 'DELETE']
+        self.assertEqual(len(deleted), len(set(deleted)))
+        # Only 11 of the 12 contents can be deleted, the other requests fill in.
+        self.assertEqual(len(generate_requests(50, {'delete': 10, 'content': 1})), 50)
+
+        # As the test client does, the test transaction has to survive the requests.
+        request_finished.disconnect(close_old_connections)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                report = run_load_test(specs, wsgi_transport(WSGIHandler(), 'testserver'), concurrency=1, total=60)
+        finally:
+            request_finished.connect(close_old_connections)
+
+        rows = {row['endpoint']: row for row in report.rows()}
+        self.assertEqual(rows['total']['requests'], 60)
+        self.assertEqual(rows['total']['error_rate'], 0)
+        self.assertEqual(rows['DELETE content-detail']['requests'], len(deleted))
+        self.assertGreater(rows['GET channel-detail']['queries'], 0)
+        self.assertIn('POST content-creation', rows)
+        self.assertLessEqual(rows['total']['p50'], rows['total']['p99'])
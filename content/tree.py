@@ -0,0 +1,207 @@
+"""
+Compact in-process index of the channel hierarchy.
+
+The hierarchy is small compared with the contents and changes rarely, so each
+process keeps it in flat arrays, loaded with a single query, to answer
+structural questions (parent, children, ancestors, whether a channel has
+contents or sub-channels) without the database.
+
+The signals bump a version stored in the cache when a commit changes the
+structure and every process reloads its index when it sees a new version.
+With a cache shared between processes, as memcached or Redis, all of them see
+the changes; with the local memory cache only the process that made them does.
+So the index may be stale and is only used to render representations, never
+to validate writes. It's loaded from the primary, as a lagging replica could
+give an outdated tree for the new version, and reloaded anyway after
+`settings.CHANNEL_TREE_MAX_AGE` seconds, to bound how stale it can be.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Sequence
+from itertools import accumulate
+from typing import Callable, cast
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+
+from content.db import use_primary
+
+VERSION_CACHE_KEY = 'channel_tree_version'
+
+# Value of attributes tracking what a model instance was loaded with, when unknown.
+UNKNOWN = object()
+
+HAS_CONTENTS = 1
+HAS_SUBCHANNELS = 2
+
+
+def children_index(parents: Sequence[int]) -> tuple[list[int], list[int]]:
+    """
+    Groups the positions of a list of nodes by the position of their parent, -1 for roots.
+
+    Returns `children` and `offsets`, the children of the node at position `i` being
+    `children[offsets[i]:offsets[i + 1]]`, in position order.
+    """
+    size = len(parents)
+    counts = Counter(parents)
+    roots = counts.pop(-1, 0)
+    # The sort is stable, so it groups children by parent keeping their order.
+    children = sorted(range(size), key=cast(Callable[[int], int], parents.__getitem__))[roots:]
+    offsets = [0, *accumulate(map(counts.__getitem__, range(size)))]
+    return children, offsets
+
+
+class ChannelNode:
+    """
+    A channel of a `ChannelTree`.
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree: ChannelTree, index: int) -> None:
+        self.tree = tree
+        self.index = index
+
+    def __repr__(self) -> str:
+        return f"<ChannelNode {self.pk}>"
+
+    @property
+    def pk(self) -> int:
+        return self.tree.ids[self.index]
+
+    @property
+    def parent_id(self) -> int | None:
+        parent = self.tree.parents[self.index]
+        return self.tree.ids[parent] if parent >= 0 else None
+
+    @property
+    def has_contents(self) -> bool:
+        return bool(self.tree.flags[self.index] & HAS_CONTENTS)
+
+    @property
+    def has_subchannels(self) -> bool:
+        return bool(self.tree.flags[self.index] & HAS_SUBCHANNELS)
+
+    @property
+    def subchannel_ids(self) -> list[int]:
+        tree = self.tree
+        return [tree.ids[child] for child in tree.children[tree.offsets[self.index]:tree.offsets[self.index + 1]]]
+
+    @property
+    def ancestor_ids(self) -> list[int]:
+        """
+        Ids of the parent, grandparent and so on up to the root.
+        """
+        ancestors: list[int] = []
+        parent = self.tree.parents[self.index]
+        while parent >= 0 and len(ancestors) < len(self.tree.ids):
+            ancestors.append(self.tree.ids[parent])
+            parent = self.tree.parents[parent]
+        return ancestors
+
+
+class ChannelTree:
+    """
+    The channel hierarchy in flat arrays indexed by position in the sorted channel ids.
+    """
+    __slots__ = ('version', 'loaded_at', 'ids', 'parents', 'children', 'offsets', 'flags')
+
+    def __init__(self, version: str, rows: Sequence[tuple[int, int | None, bool]]) -> None:
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.ids = array('q', (pk for pk, _parent_id, _has_contents in rows))
+        self.parents = array('q', (
+            self._position(parent_id) if parent_id is not None else -1
+            for _pk, parent_id, _has_contents in rows
+        ))
+        children, offsets = children_index(self.parents)
+        self.children = array('q', children)
+        self.offsets = array('q', offsets)
+        self.flags = bytearray(
+            (HAS_CONTENTS if has_contents else 0) | (HAS_SUBCHANNELS if offsets[index] != offsets[index + 1] else 0)
+            for index, (_pk, _parent_id, has_contents) in enumerate(rows)
+        )
+
+    @classmethod
+    def load(cls, version: str) -> ChannelTree:
+        from content.models import Channel, Content
+
+        rows = (
+            Channel.objects
+            .order_by('pk')
+            .values_list('pk', 'parent_id', Exists(Content.objects.filter(channel=OuterRef('pk'))))
+        )
+        with use_primary():
+            return cls(version, list(rows))
+
+    def is_current(self, version: str) -> bool:
+        return self.version == version and time.monotonic() - self.loaded_at < settings.CHANNEL_TREE_MAX_AGE
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, pk: object) -> bool:
+        return isinstance(pk, int) and self._position(pk) >= 0
+
+    def _position(self, pk: int) -> int:
+        index = bisect_left(self.ids, pk)
+        return index if index < len(self.ids) and self.ids[index] == pk else -1
+
+    def node(self, pk: int) -> ChannelNode | None:
+        index = self._position(pk)
+        return ChannelNode(self, index) if index >= 0 else None
+
+    def has_contents(self, pk: int) -> bool:
+        node = self.node(pk)
+        return node is not None and node.has_contents
+
+    def has_subchannels(self, pk: int) -> bool:
+        node = self.node(pk)
+        return node is not None and node.has_subchannels
+
+
+_lock = threading.Lock()
+_tree: ChannelTree | None = None
+
+
+def _set_version() -> None:
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def bump_version() -> None:
+    """
+    Makes every process reload its channel tree on its next use, once the current transaction commits.
+    """
+    transaction.on_commit(_set_version)
+
+
+def channel_tree() -> ChannelTree:
+    """
+    Returns the channel tree of this process, reloading it if its version is outdated or it's too old.
+    Trees loaded within a transaction aren't kept, they could have rows it rolls back.
+    """
+    global _tree
+
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_CACHE_KEY)
+
+    tree = _tree
+    if tree is not None and tree.is_current(version):
+        return tree
+
+    with _lock:
+        if _tree is not None and _tree.is_current(version):
+            return _tree
+        tree = ChannelTree.load(version)
+        if not any(connection.in_atomic_block for connection in connections.all(initialized_only=True)):
+            _tree = tree
+        return tree
@@ -1,12 +1,16 @@
 from django.urls import path
-from content.views import ChannelList, ChannelDetails, ContentCreation, ContentDetails, ContentFileUpload
+from content.views import AdmissionMetrics, ChannelList, ChannelTop, ChannelDetails, ChannelDeletion, ContentCreation, ContentDetails, ContentFileUpload
 
 
 urlpatterns = [
     path('', ChannelList.as_view(), name='channel-list'),
+    path('channels/top/', ChannelTop.as_view(), name='channel-top'),
     path('channels/<int:pk>/', ChannelDetails.as_view(), name='channel-detail'),
+    path('channels/deletions/<uuid:job_id>/', ChannelDeletion.as_view(), name='channel-deletion'),
 
     path('channels/<int:pk>/content/', ContentCreation.as_view(), name='content-creation'),
     path('contents/<int:pk>/', ContentDetails.as_view(), name='content-detail'),
     path('contents/<int:pk>/<str:filename>/', ContentFileUpload.as_view(), name='content-files'),
+
+    path('metrics/admission/', AdmissionMetrics.as_view(), name='admission-metrics'),
 ]
@@ -1,14 +1,22 @@
-from urllib.request import Request
+from typing import Any
+from uuid import UUID
 
 from django.core.serializers import serialize
 from django.http import HttpRequest
 from django.shortcuts import render
+from django.urls import reverse
 from rest_framework import status, generics
 from rest_framework.parsers import FormParser, MultiPartParser, FileUploadParser
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from content.serializers import ChannelSerializer, ContentSerializer, ContentFileSerializer
+from content.serializers import ChannelSerializer, ChannelTopQuerySerializer, ContentSerializer, ContentFileSerializer
+from content import middleware, singleflight
+from content.deletion import get_job, job_representation, start_subtree_deletion
 from content.models import Channel, Content, ContentFile
+from content.renderers import exact_floats
+from content.representations import CHANNEL_FIELDS, CONTENT_FIELDS, channel_representations, content_representation
+from content.warmup import record_channel_read
 
 
 class ChannelList(generics.ListAPIView[Channel]):
@@ -18,6 +26,13 @@ class ChannelList(generics.ListAPIView[Channel]):
     serializer_class = ChannelSerializer
     queryset = Channel.objects.filter(parent=None)
 
+    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        Lists the page of channels with the read-optimized representation, same as `ChannelSerializer`.
+        """
+        page = self.paginate_queryset(self.get_queryset().values(*CHANNEL_FIELDS))
+        return self.get_paginated_response(channel_representations(page or []))
+
     def get_serializer_context(self) -> dict[str, None | HttpRequest | generics.GenericAPIView[Channel]]:
         """
         Sobrescribe el contexto para excluir el request.
@@ -34,6 +49,27 @@ class ChannelList(generics.ListAPIView[Channel]):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ChannelTop(APIView):
+    """
+    List the top rated channels, optionally filtered by language or within the subtree of a root channel.
+    """
+
+    def get(self, request: Request) -> Response:
+        query = ChannelTopQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        channels = Channel.objects.filter(indexed_rating__isnull=False)
+        if 'language' in query.validated_data:
+            channels = channels.filter(language=query.validated_data['language'])
+        if 'root' in query.validated_data:
+            root = generics.get_object_or_404(Channel, pk=query.validated_data['root'])
+            channels = channels.filter(pk__in=root.descendants().values('pk'))
+
+        channels = channels.order_by('-indexed_rating', 'pk')[:query.validated_data['n']]
+        return Response(channel_representations(channels.values(*CHANNEL_FIELDS)))
+
+
 class ChannelDetails(generics.GenericAPIView[Channel]):
     """
     Retrieve, update or delete a channel instance.
@@ -41,11 +77,9 @@ class ChannelDetails(generics.GenericAPIView[Channel]):
     serializer_class = ChannelSerializer
 
     def get(self, request: Request, pk: int) -> Response:
-        channel = generics.get_object_or_404(Channel, pk=pk)
-        serializer = ChannelSerializer(channel, context={'request': None})
-        data = serializer.data
-        data.pop('channel', None)
-        return Response(data)
+        channel = generics.get_object_or_404(Channel.objects.values(*CHANNEL_FIELDS), pk=pk)
+        record_channel_read(channel['pk'])
+        return Response(channel_representations([channel], identity=False)[0])
 
     def post(self, request: Request, pk: int) -> Response:
         parent_channel = generics.get_object_or_404(Channel, pk=pk)
@@ -76,9 +110,25 @@ class ChannelDetails(generics.GenericAPIView[Channel]):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request: Request, pk: int) -> Response:
-        channel = generics.get_object_or_404(Channel, pk=pk)
-        channel.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        """
+        Starts the deletion of the channel and its subtree, whose progress is polled at the `Location` URL.
+        """
+        channel = generics.get_object_or_404(Channel.objects.only('pk'), pk=pk)
+        job = start_subtree_deletion(channel.pk)
+        location = reverse('channel-deletion', kwargs={'job_id': job.id})
+        return Response(job_representation(job), status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+class ChannelDeletion(APIView):
+    """
+    Retrieve the status of a channel deletion.
+    """
+
+    def get(self, request: Request, job_id: UUID) -> Response:
+        job = get_job(job_id)
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(job_representation(job))
 
 
 class ContentCreation(APIView):
@@ -91,7 +141,8 @@ class ContentCreation(APIView):
         serializer = ContentSerializer(data=request.data, context={'request': None})
         if serializer.is_valid():
             serializer.save(channel=channel)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            data = serializer.data
+            return Response(exact_floats(data, data['metadata']), status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -102,11 +153,8 @@ class ContentDetails(generics.GenericAPIView[Content]):
     serializer_class = ContentSerializer
 
     def get(self, request: Request, pk: int) -> Response:
-        content = generics.get_object_or_404(Content, pk=pk)
-        serializer = ContentSerializer(content, context={'request': None})
-        data = serializer.data
-        data.pop('content', None)
-        return Response(data)
+        content = generics.get_object_or_404(Content.objects.values(*CONTENT_FIELDS), pk=pk)
+        return Response(content_representation(content, identity=False))
 
     def put(self, request: Request, pk: int) -> Response:
         content = generics.get_object_or_404(Content, pk=pk)
@@ -115,7 +163,7 @@ class ContentDetails(generics.GenericAPIView[Content]):
             serializer.save()
             data = serializer.data
             data.pop('content', None)
-            return Response(data)
+            return Response(exact_floats(data, data['metadata']))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def patch(self, request: Request, pk: int) -> Response:
@@ -125,7 +173,7 @@ class ContentDetails(generics.GenericAPIView[Content]):
             serializer.save()
             data = serializer.data
             data.pop('content', None)
-            return Response(data)
+            return Response(exact_floats(data, data['metadata']))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request: Request, pk: int) -> Response:
@@ -169,3 +217,15 @@ class ContentFileUpload(generics.GenericAPIView[ContentFile]):
         file = content.files.get(file__contains=filename)
         file.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AdmissionMetrics(APIView):
+    """
+    Retrieve the admission control and single-flight counters of this process.
+    """
+
+    def get(self, request: Request) -> Response:
+        return Response({
+            'admission': {name: limiter.snapshot() for name, limiter in middleware.limiters.items()},
+            'singleflight': singleflight.stats.snapshot(),
+        })
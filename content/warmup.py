@@ -0,0 +1,164 @@
+"""
+Warm-up of the channel rating cache.
+
+After a deploy, a restart or a cache flush every `Channel.rating()` misses and
+recomputes its subtree. The warm-up computes all the ratings at once with the
+batch engine and fills the cache in batches, throttled to leave room for live
+traffic. Caches evict the least recently written entries first, so the
+ratings are written from the least to the most important, roots and most read
+channels last, and no more than `settings.RATING_WARMUP_MAX_CHANNELS`, to
+leave room in the cache for everything else. Ratings invalidated while the
+warm-up runs are recomputed, see `warm_rating_cache()`.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from content import singleflight
+from content.models import Channel
+from content.ratings import batch_ratings
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupResult(NamedTuple):
+    # Ratings written, those already cached aren't.
+    warmed: int
+    # Ratings of the prioritized channels in the cache once done.
+    cached: int
+    # Channels prioritized, at most `settings.RATING_WARMUP_MAX_CHANNELS`.
+    channels: int
+
+
+def _reads_cache_key(pk: int) -> str:
+    return f"channel_reads_{pk}"
+
+
+def record_channel_read(pk: int) -> None:
+    """
+    Counts a read of a channel, to warm up the most read channels first.
+    """
+    key = _reads_cache_key(pk)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Removed between both calls, the read is not worth a retry.
+            pass
+
+
+def _chunks(items: list[int], size: int) -> Iterator[list[int]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def warmup_order(ratings: dict[int, Decimal | None], roots: set[int], batch_size: int) -> list[int]:
+    """
+    Returns the channels of `ratings` sorted by warm-up priority: roots,
+    then by number of reads and then by id.
+    """
+    reads: dict[int, int] = {}
+    for chunk in _chunks(list(ratings), batch_size):
+        counts = cache.get_many([_reads_cache_key(pk) for pk in chunk])
+        reads.update((pk, counts.get(_reads_cache_key(pk), 0)) for pk in chunk)
+
+    return sorted(ratings, key=lambda pk: (pk not in roots, -reads[pk], pk))
+
+
+def warm_rating_cache(
+    rate: float | None = None,
+    batch_size: int | None = None,
+    progress: Callable[[int, int], None] | None = None,
+) -> WarmupResult:
+    """
+    Fills the rating cache of the channels not cached yet, up to `settings.RATING_WARMUP_MAX_CHANNELS`
+    in priority order.
+
+    `rate` limits the channels written per second, `None` or 0 doesn't throttle.
+    Ratings already cached are never overwritten. If any rating is invalidated
+    while a batch is written, the ratings of the batch are removed, as they may
+    have been written after the invalidation, and all of them are recomputed
+    before writing the batch again. The warmed up ones also expire after
+    `settings.RATING_WARMUP_TIMEOUT`.
+    """
+    rate = settings.RATING_WARMUP_RATE if rate is None else rate
+    batch_size = batch_size or settings.RATING_WARMUP_BATCH_SIZE
+
+    generation = singleflight.generation()
+    ratings = batch_ratings()
+    roots = set(Channel.objects.filter(parent=None).values_list('pk', flat=True))
+    order = warmup_order(ratings, roots, batch_size)[:settings.RATING_WARMUP_MAX_CHANNELS]
+
+    warmed = 0
+    started = time.monotonic()
+    for done, chunk in enumerate(_chunks(order[::-1], batch_size), start=1):
+        while True:
+            added = _add_ratings(chunk, ratings)
+            current = singleflight.generation()
+            if current == generation:
+                break
+            cache.delete_many(added)
+            generation = current
+            ratings = batch_ratings()
+        warmed += len(added)
+
+        if progress:
+            progress(min(done * batch_size, len(order)), len(order))
+        if rate:
+            delay = started + done * batch_size / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    kept = sum(
+        len(cache.get_many([Channel.rating_cache_key(pk) for pk in chunk])) for chunk in _chunks(order, batch_size)
+    )
+    return WarmupResult(warmed, kept, len(order))
+
+
+def _add_ratings(chunk: list[int], ratings: dict[int, Decimal | None]) -> list[str]:
+    """
+    Caches the ratings of the channels of `chunk` not cached yet and returns their keys.
+    """
+    # Channels deleted since the warm-up started have no rating.
+    keys = {Channel.rating_cache_key(pk): pk for pk in chunk if pk in ratings}
+    cached = cache.get_many(list(keys))
+    # `set_many` would overwrite ratings cached since `get_many`.
+    return [
+        key for key, pk in keys.items()
+        if key not in cached and cache.add(key, ratings[pk], timeout=settings.RATING_WARMUP_TIMEOUT)
+    ]
+
+
+def _warm_up_in_background() -> None:
+    def run() -> None:
+        time.sleep(settings.RATING_WARMUP_DELAY)
+        try:
+            result = warm_rating_cache()
+        except DatabaseError:
+            logger.exception("Rating cache warm-up failed")
+            return
+        logger.info(
+            "Rating cache warm-up filled %d channel ratings, %d of %d prioritized are cached",
+            *result
+        )
+
+    threading.Thread(target=run, name='rating-cache-warmup', daemon=True).start()
+
+
+def schedule_startup_warmup() -> None:
+    """
+    Warms up the rating cache in a background thread of this process, and
+    of every worker forked from it, as threads don't survive a fork.
+    """
+    _warm_up_in_background()
+    os.register_at_fork(after_in_child=_warm_up_in_background)